@@ -1,81 +1,104 @@
 
 
 from typing import TypedDict
-from langgraph.graph import StateGraph, START, END
-from utils.llm_client import Claude3_7SonnetFactory
+from utils.llm_client import Claude3_7SonnetFactory, output_budget
+from utils.streaming_gates import contains_any
 
 
 
-llm = Claude3_7SonnetFactory().create_client()
+def get_llm():
+    """Bedrock client, created on first use so importing this module stays cheap"""
+    return Claude3_7SonnetFactory().create_client()
 
 class State(TypedDict):
     topic: str
     joke: str
-    improve_joke: str
+    improved_joke: str
     polished_joke: str
+    punchline: str
 
 
 
+# Gate on the joke: "Pass" if it contains a "?" or "!". Both branches need the whole joke, so the
+# gate is evaluated on the finished text; streaming would only skip the response cache, single
+# flight and hedging of invoke() without stopping anything early.
+punchline_gate = contains_any("punchline", "?!", found="Pass", missing="Fail")
+
+
+output_budget("generate_joke", 512)
+
+
 def generate_joke(state: State):
-    """First LLM call to generate the joke"""
-    
-    msg = llm.invoke(f"Write a joke about {state['topic']}")
-    return {"joke": msg.content}
+    """First LLM call to generate the joke, with the punchline gate evaluated on it"""
+    msg = get_llm().invoke(f"Write a joke about {state['topic']}")
+    return {"joke": msg.content, "punchline": punchline_gate.evaluate(msg.content)}
+
+
+output_budget("improve_joke", 512)
 
 
 def improve_joke(state: State):
     """Second LLM call to improve the joke"""
     
-    msg = llm.invoke(f"Make this joke funnier by mocking the punchline: {state['joke']}")
-    return {"improve_joke": msg.content}
+    msg = get_llm().invoke(f"Make this joke funnier by mocking the punchline: {state['joke']}")
+    return {"improved_joke": msg.content}
+
+output_budget("polish_joke", 512)
+
 
 def polish_joke(state: State):
     """Third LLM call to polish the joke"""
     
-    msg = llm.invoke(f"Add a surprising twist to the joke: {state['improve_joke']}")
+    msg = get_llm().invoke(f"Add a surprising twist to the joke: {state['improved_joke']}")
     return {"polished_joke": msg.content}
 
 
 def check_punchline(state: State):
     """Gate function to check if the joke has a punchline"""
 
-    # Simple check - does the joke contain "?" or "!"
-    if "?" in state["joke"] or "!" in state["joke"]:
-        return "Pass"
-    return "Fail"
+    # Simple check - does the joke contain "?" or "!" (already decided by generate_joke)
+    return state.get("punchline") or punchline_gate.evaluate(state["joke"])
+
+
+def build_graph():
+    """Compile the prompt chaining workflow"""
+    from langgraph.graph import StateGraph, START, END
+    from utils.tracing import instrument
 
+    workflow = StateGraph(State)
 
-workflow = StateGraph(State)
+    workflow.add_node("generate_joke", generate_joke)
+    workflow.add_node("improve_joke", improve_joke)
+    workflow.add_node("polish_joke", polish_joke)
 
-workflow.add_node("generate_joke", generate_joke)
-workflow.add_node("improve_joke", improve_joke)
-workflow.add_node("polish_joke", polish_joke)
 
+    workflow.add_edge(START, "generate_joke")
+    workflow.add_conditional_edges(
+        "generate_joke",
+        check_punchline,
+        {
+            "Fail": "improve_joke",
+            "Pass": END
+        }
+    )
 
-workflow.add_edge(START, "generate_joke")
-workflow.add_conditional_edges(
-    "generate_joke",
-    check_punchline,
-    {
-        "Fail": "improve_joke",
-        "Pass": END
-    }
-)
+    workflow.add_edge("improve_joke", "polish_joke")
+    workflow.add_edge("polish_joke", END)
 
-workflow.add_edge("improve_joke", "polish_joke")
-workflow.add_edge("polish_joke", END)
 
 
+    # Compile
+    return instrument(workflow.compile())
 
-# Compile
-chain = workflow.compile()
 
+if __name__ == "__main__":
+    chain = build_graph()
 
-# Show workflow in terminal
-print("\nWorkflow Graph:")
-print(chain.get_graph().draw_mermaid())
+    # Show workflow in terminal
+    print("\nWorkflow Graph:")
+    print(chain.get_graph().draw_mermaid())
 
 
-# Invoke
-state = chain.invoke({"topic": "Software Engineers"})
-print(state)
\ No newline at end of file
+    # Invoke
+    state = chain.invoke({"topic": "Software Engineers"})
+    print(state)
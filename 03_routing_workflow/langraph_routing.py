@@ -1,11 +1,17 @@
-from typing import TypedDict
+import random
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, TypedDict
 from typing_extensions import Literal
 from pydantic import BaseModel, Field
-from utils.llm_client import Claude3_7SonnetFactory
+from utils.cascade import model_cascade
+from utils.llm_client import Claude3_7SonnetFactory, batch, get_executor, output_budget
+from utils.local_router import DecisionLog, NaiveBayesRouter, RouterMetrics
 from langchain_core.messages import HumanMessage, SystemMessage
-from langgraph.graph import StateGraph, START, END
 
-llm = Claude3_7SonnetFactory().create_client()
+
+def get_llm():
+    """Bedrock client, created on first use so importing this module stays cheap"""
+    return Claude3_7SonnetFactory().create_client()
 
 
 # Schema for structured output to use as routing logic
@@ -13,8 +19,29 @@ class Route(BaseModel):
     step: Literal["poem", "story", "joke"] = Field(None, description="The step to take")
 
 
-# Augment the LLM with schema for structured output
-router_llm = llm.with_structured_output(Route)
+@lru_cache(maxsize=None)
+def get_router_llm():
+    # Augment the LLM with schema for structured output. With "router" in
+    # LLM_CASCADE_NODES a smaller model routes first, escalating when it names no route
+    return model_cascade(
+        "router",
+        lambda llm: llm.with_structured_output(Route),
+        accept=lambda route: route is not None and route.step in ROUTES,
+    )
+
+
+class Routes(BaseModel):
+    routes: List[Route] = Field(description="One route per numbered input, in the same order")
+
+
+# One route per input of a chunk (see BATCH_CHUNK_SIZE)
+output_budget("batch_router", 2048)
+
+
+@lru_cache(maxsize=None)
+def get_batch_router_llm():
+    return get_llm().with_structured_output(Routes)
+
 
 class State(TypedDict):
     input: str
@@ -22,33 +49,96 @@ class State(TypedDict):
     output: str
 
 
+output_budget("story_writer", 4096)
+
+
 def story_writer(state: State):
     
-    result = llm.invoke(f"{state['input']}")
+    result = get_llm().invoke(f"{state['input']}")
     return {"output": result.content}
 
 
+output_budget("poem_writer", 1024)
+
+
 def poem_writer(state: State):
     
-    result = llm.invoke(f"{state['input']}")
+    result = get_llm().invoke(f"{state['input']}")
     return {"output": result.content}
 
 
+output_budget("joke_writer", 512)
+
+
 def joke_writer(state: State):
     
-    result = llm.invoke(f"{state['input']}")
+    result = get_llm().invoke(f"{state['input']}")
     return {"output": result.content}
 
 
 
-def router(state: State):
-    
+def llm_route(text: str) -> str:
     # Run the augmented LLM with structured output to serve as routing logic
-    decision = router_llm.invoke([
+    decision = get_router_llm().invoke([
         SystemMessage(content="You are a routing agent. You are given a user input and you need to decide which step to take."),
-        HumanMessage(content=state["input"])
+        HumanMessage(content=text)
     ])
-    return {"decision": decision.step}
+    return decision.step
+
+
+# A single Route tool call
+output_budget("router", 256)
+
+
+def router(state: State):
+    
+    return {"decision": llm_route(state["input"])}
+
+
+ROUTES = ("poem", "story", "joke")
+
+# Metrics of the fast-path router, shared by graphs built without their own
+router_metrics = RouterMetrics()
+
+
+def make_fast_router(
+    local_router: Optional[NaiveBayesRouter] = None,
+    confidence_threshold: float = 0.9,
+    metrics: Optional[RouterMetrics] = None,
+    decision_log: Optional[DecisionLog] = None,
+    shadow_rate: float = 0.0,
+):
+    """Router node that trusts ``local_router`` above ``confidence_threshold``.
+
+    Anything less confident goes to the LLM router, and every LLM decision is
+    compared with the local guess (for ``metrics``) and appended to
+    ``decision_log`` so the local router can be retrained on it. A
+    ``shadow_rate`` fraction of confident decisions is also re-checked by the
+    LLM in the background, which measures the accuracy of the fast path
+    without adding to its latency.
+    """
+    metrics = metrics or router_metrics
+
+    def check(text: str, predicted: Optional[str], confident: bool) -> str:
+        decision = llm_route(text)
+        metrics.record_comparison(predicted, decision, confident=confident)
+        if decision_log is not None:
+            decision_log.append(text, decision)
+        return decision
+
+    def fast_router(state: State):
+        text = state["input"]
+        predicted, confidence = local_router.predict(text) if local_router else (None, 0.0)
+        if predicted in ROUTES and confidence >= confidence_threshold:
+            metrics.record_local()
+            if shadow_rate and random.random() < shadow_rate:
+                get_executor().submit(check, text, predicted, True)
+            return {"decision": predicted}
+
+        metrics.record_fallback()
+        return {"decision": check(text, predicted, False)}
+
+    return fast_router
 
 
 # Conditional edge function to route to the appropriate node
@@ -62,36 +152,139 @@ def route_decision(state: State):
         return "joke_writer"
 
 
-router_builder = StateGraph(State)
+# Inputs classified per structured-output call in batch mode
+BATCH_CHUNK_SIZE = 25
+
+
+def _batch_routing_prompt(texts: List[str]):
+    numbered = "\n".join(f"{i}. {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+    return [
+        SystemMessage(content=(
+            "You are a routing agent. You are given numbered user inputs and you need to decide which step "
+            f"to take for each one. Return exactly {len(texts)} routes, in the same order as the inputs."
+        )),
+        HumanMessage(content=numbered),
+    ]
+
+
+def batch_route(texts: List[str], chunk_size: int = BATCH_CHUNK_SIZE, max_concurrency: Optional[int] = None) -> List[Any]:
+    """Route many inputs with one LLM call per ``chunk_size`` inputs.
+
+    Returns one decision per input, in input order. A chunk whose answer
+    cannot be trusted (the call failed, or the number of routes does not
+    match) is re-routed one input at a time, and an input that still fails
+    gets its exception in place of a decision.
+    """
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    # Tagged like graph nodes, for their output budgets, deadlines and tracing
+    answers = batch(get_batch_router_llm(), [_batch_routing_prompt(chunk) for chunk in chunks],
+                    max_concurrency=max_concurrency, return_exceptions=True,
+                    config={"metadata": {"langgraph_node": "batch_router"}})
+
+    decisions: List[Any] = []
+    for chunk, answer in zip(chunks, answers):
+        if isinstance(answer, Routes) and len(answer.routes) == len(chunk):
+            decisions.extend(route.step for route in answer.routes)
+        else:
+            decisions.extend([None] * len(chunk))
+
+    retry = [i for i, decision in enumerate(decisions) if decision not in ROUTES]
+    if retry:
+        answers = batch(get_router_llm(), [[
+            SystemMessage(content="You are a routing agent. You are given a user input and you need to decide which step to take."),
+            HumanMessage(content=texts[i]),
+        ] for i in retry], max_concurrency=max_concurrency, return_exceptions=True,
+            config={"metadata": {"langgraph_node": "router"}})
+        for i, answer in zip(retry, answers):
+            if isinstance(answer, Exception):
+                decisions[i] = answer
+            elif answer is None:
+                # The model answered without the Route tool call
+                decisions[i] = ValueError(f"No route for input {i}: no tool call")
+            elif answer.step not in ROUTES:
+                decisions[i] = ValueError(f"No route for input {i}: {answer.step!r}")
+            else:
+                decisions[i] = answer.step
+    return decisions
+
+
+def run_batch(inputs: List[str], chunk_size: int = BATCH_CHUNK_SIZE, max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Batch mode of the routing workflow: route in chunks, then write in parallel.
+
+    Returns one state per input, in input order. A failed input does not
+    affect the others; its state carries ``error`` instead of ``output``.
+    """
+    from langchain_core.runnables import RunnableLambda
+
+    writers = {"poem": poem_writer, "story": story_writer, "joke": joke_writer}
+    states: List[Dict[str, Any]] = []
+    for text, decision in zip(inputs, batch_route(inputs, chunk_size, max_concurrency)):
+        if isinstance(decision, Exception):
+            states.append({"input": text, "error": repr(decision)})
+        else:
+            states.append({"input": text, "decision": decision})
+
+    routed = [state for state in states if "decision" in state]
+
+    def write(state: Dict[str, Any]):
+        # A child run tagged like the writer's own node, for tracing, budgets and deadlines
+        node = f"{state['decision']}_writer"
+        return RunnableLambda(writers[state["decision"]], name=node).invoke(state, {"metadata": {"langgraph_node": node}})
+
+    for state, result in zip(routed, batch(RunnableLambda(write), routed, max_concurrency=max_concurrency, return_exceptions=True)):
+        if isinstance(result, Exception):
+            state["error"] = repr(result)
+        else:
+            state.update(result)
+    return states
+
+
+def build_graph(local_router: Optional[NaiveBayesRouter] = None, decision_log: Optional[DecisionLog] = None, **fast_router_kwargs):
+    """Compile the routing workflow
+
+    Pass a trained ``local_router`` to skip the LLM routing call whenever it
+    is confident, and/or a ``decision_log`` to record LLM decisions as
+    training data; see :func:`make_fast_router` for the other options.
+    """
+    from langgraph.graph import StateGraph, START, END
+    from utils.tracing import instrument
+
+    router_builder = StateGraph(State)
+
+    if local_router is None and decision_log is None:
+        router_builder.add_node("router", router)
+    else:
+        router_builder.add_node("router", make_fast_router(local_router, decision_log=decision_log, **fast_router_kwargs))
+    router_builder.add_node("poem_writer", poem_writer)
+    router_builder.add_node("story_writer", story_writer)
+    router_builder.add_node("joke_writer", joke_writer)
 
-router_builder.add_node("router", router)
-router_builder.add_node("poem_writer", poem_writer)
-router_builder.add_node("story_writer", story_writer)
-router_builder.add_node("joke_writer", joke_writer)
+    router_builder.add_edge(START, "router")
+    router_builder.add_conditional_edges(
+        "router",
+        route_decision,
+        {
+            "poem_writer": "poem_writer",
+            "story_writer": "story_writer",
+            "joke_writer": "joke_writer",
+        }
+    )
 
-router_builder.add_edge(START, "router")
-router_builder.add_conditional_edges(
-    "router",
-    route_decision,
-    {
-        "poem_writer": "poem_writer",
-        "story_writer": "story_writer",
-        "joke_writer": "joke_writer",
-    }
-)
+    router_builder.add_edge("poem_writer", END)
+    router_builder.add_edge("story_writer", END)
+    router_builder.add_edge("joke_writer", END)
 
-router_builder.add_edge("poem_writer", END)
-router_builder.add_edge("story_writer", END)
-router_builder.add_edge("joke_writer", END)
+    # Compile workflow
+    return instrument(router_builder.compile())
 
-# Compile workflow
-router_workflow = router_builder.compile()
 
+if __name__ == "__main__":
+    router_workflow = build_graph()
 
-# Show workflow in terminal
-print("\nWorkflow Graph:")
-print(router_workflow.get_graph().draw_mermaid())
+    # Show workflow in terminal
+    print("\nWorkflow Graph:")
+    print(router_workflow.get_graph().draw_mermaid())
 
-# Invoke
-state = router_workflow.invoke({"input": "Write me a poem about stock market and life of a software engineer"})
-print(state)
+    # Invoke
+    state = router_workflow.invoke({"input": "Write me a poem about stock market and life of a software engineer"})
+    print(state)
@@ -1,7 +1,14 @@
 
-from typing import TypedDict
-from utils.llm_client import Claude3_7SonnetFactory
-from langgraph.graph import StateGraph, START, END
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Any, Dict, Optional, TypedDict
+
+import settings
+
+from utils.llm_client import Claude3_7SonnetFactory, output_budget
 
 
 class State(TypedDict):
@@ -10,55 +17,193 @@ class State(TypedDict):
     story: str
     joke: str
     combined_result: str
+    branch_timings: Dict[str, Dict[str, Any]]
+
+
+def get_llm():
+    """Bedrock client, created on first use so importing this module stays cheap"""
+    return Claude3_7SonnetFactory().create_client()
 
 
-llm = Claude3_7SonnetFactory().create_client()
+output_budget("poem_writer", 1024)
 
 
 def poem_writer(state: State):
-    result = llm.invoke(f"Write a poem about {state['topic']}")
+    result = get_llm().invoke(f"Write a poem about {state['topic']}")
     return {"poem": result.content}
 
 
+output_budget("story_writer", 4096)
+
+
 def story_writer(state: State):
-    result = llm.invoke(f"Write a story about {state['topic']}")
+    result = get_llm().invoke(f"Write a story about {state['topic']}")
     return {"story": result.content}
 
 
+output_budget("joke_writer", 512)
+
+
 def joke_writer(state: State):
-    result = llm.invoke(f"Write a joke about {state['topic']}")
+    result = get_llm().invoke(f"Write a joke about {state['topic']}")
     return {"joke": result.content}
 
 
+# Branch (state key) -> writer node, for the deadline/quorum fan-in
+BRANCHES = {"poem": poem_writer, "story": story_writer, "joke": joke_writer}
+
+# Stands in for a branch that did not finish before the deadline or quorum
+MISSING = "[not finished in time]"
+# Stands in for a branch whose writer failed
+FAILED = "[failed]"
+
+# Writers of every fan-in run in this process; stragglers keep a thread until their deadline
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_fan_in_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.LLM_MAX_CONCURRENCY, thread_name_prefix="fan-in")
+    return _pool
+
+
+def _reinit_after_fork():
+    global _pool, _pool_lock
+    # The parent's pool threads do not exist in the child
+    _pool, _pool_lock = None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+def make_fan_in(deadline: Optional[float] = None, quorum: Optional[int] = None):
+    """Node that runs the three writers and returns without waiting for stragglers.
+
+    It returns as soon as ``quorum`` writers have finished (default: all of
+    them) or ``deadline`` seconds have passed, whichever comes first. Writers
+    still running are detached, and their branch is left out of the state.
+    The writers of all runs share one pool of ``LLM_MAX_CONCURRENCY``
+    threads; a writer that has not started by the time its run returns is
+    cancelled. With a deadline, every writer's model call also uses it as
+    its read timeout, and a call still queued in the rate limiter at the
+    deadline is not sent, so a straggler gives up its connection and
+    limiter slot at the deadline instead of running to completion.
+    ``branch_timings`` records each branch's status (``ok``, ``error`` or
+    ``missing``) and seconds.
+    """
+    if quorum is not None and not 1 <= quorum <= len(BRANCHES):
+        raise ValueError(f"quorum must be between 1 and {len(BRANCHES)}, got {quorum}")
+    needed = quorum or len(BRANCHES)
+
+    def writers(state: State):
+        from langchain_core.runnables import RunnableLambda
+        from utils.llm_client import call_deadline
+
+        started = time.perf_counter()
+        expires = time.monotonic() + deadline if deadline is not None else None
+
+        def run(name: str, writer):
+            # A child run tagged like the writer's own node, for tracing, budgets and deadlines
+            runnable = RunnableLambda(writer, name=f"{name}_writer")
+            config = {"metadata": {"langgraph_node": f"{name}_writer"}}
+            if deadline is None:
+                return runnable.invoke(state, config)
+            # Measured from the start of the fan-in, however long the writer queued for a thread
+            with call_deadline(deadline, expires):
+                return runnable.invoke(state, config)
+
+        update: Dict[str, Any] = {}
+        timings: Dict[str, Dict[str, Any]] = {}
+        pool = get_fan_in_pool()
+        pending = {pool.submit(copy_context().run, run, name, writer): name for name, writer in BRANCHES.items()}
+        try:
+            finished = 0
+            while pending and finished < needed:
+                timeout = None if deadline is None else max(0.0, started + deadline - time.perf_counter())
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    name = pending.pop(future)
+                    seconds = round(time.perf_counter() - started, 3)
+                    if future.exception() is not None:
+                        timings[name] = {"status": "error", "seconds": seconds, "error": repr(future.exception())}
+                        continue
+                    update.update(future.result())
+                    timings[name] = {"status": "ok", "seconds": seconds}
+                    finished += 1
+        finally:
+            for future in pending:
+                future.cancel()
+        for name in pending.values():
+            timings[name] = {"status": "missing", "seconds": round(time.perf_counter() - started, 3)}
+        return {**update, "branch_timings": timings}
+
+    return writers
+
+
 def aggregate_results(state: State):
     """Combine the joke and story into a single output"""
-    combined = f"Here is the combined result on the topic {state['topic']}: \n Poem: {state['poem']} \n Story: {state['story']} \n Joke: {state['joke']}"
+    # In deadline/quorum mode a branch may be missing or have failed
+    timings = state.get("branch_timings") or {}
+    poem, story, joke = (
+        state.get(name) or (FAILED if timings.get(name, {}).get("status") == "error" else MISSING)
+        for name in BRANCHES
+    )
+    combined = f"Here is the combined result on the topic {state['topic']}: \n Poem: {poem} \n Story: {story} \n Joke: {joke}"
     return {"combined_result": combined}
 
 
-parallel_builder = StateGraph(State)
+def build_graph(deadline: Optional[float] = None, quorum: Optional[int] = None):
+    """Compile the parallel workflow
+
+    By default ``aggregate_results`` waits for all three writers. With a
+    ``deadline`` (seconds) and/or a ``quorum`` (writers needed), a single
+    ``writers`` node runs them instead and aggregation goes ahead with
+    whatever finished (see ``make_fan_in``).
+    """
+    from langgraph.graph import StateGraph, START, END
+    from utils.tracing import instrument
+
+    parallel_builder = StateGraph(State)
+
+    if deadline is not None or quorum is not None:
+        parallel_builder.add_node("writers", make_fan_in(deadline, quorum))
+        parallel_builder.add_node("aggregate_results", aggregate_results)
+        parallel_builder.add_edge(START, "writers")
+        parallel_builder.add_edge("writers", "aggregate_results")
+        parallel_builder.add_edge("aggregate_results", END)
+        return instrument(parallel_builder.compile())
+
+    parallel_builder.add_node("poem_writer", poem_writer)
+    parallel_builder.add_node("story_writer", story_writer)
+    parallel_builder.add_node("joke_writer", joke_writer)
+    parallel_builder.add_node("aggregate_results", aggregate_results)
 
-parallel_builder.add_node("poem_writer", poem_writer)
-parallel_builder.add_node("story_writer", story_writer)
-parallel_builder.add_node("joke_writer", joke_writer)
-parallel_builder.add_node("aggregate_results", aggregate_results)
+    parallel_builder.add_edge(START, "poem_writer")
+    parallel_builder.add_edge(START, "story_writer")
+    parallel_builder.add_edge(START, "joke_writer")
+    parallel_builder.add_edge("poem_writer", "aggregate_results")
+    parallel_builder.add_edge("story_writer", "aggregate_results")
+    parallel_builder.add_edge("joke_writer", "aggregate_results")
 
-parallel_builder.add_edge(START, "poem_writer")
-parallel_builder.add_edge(START, "story_writer")
-parallel_builder.add_edge(START, "joke_writer")
-parallel_builder.add_edge("poem_writer", "aggregate_results")
-parallel_builder.add_edge("story_writer", "aggregate_results")
-parallel_builder.add_edge("joke_writer", "aggregate_results")
+    parallel_builder.add_edge("aggregate_results", END)
 
-parallel_builder.add_edge("aggregate_results", END)
+    return instrument(parallel_builder.compile())
 
-parallel_workflow = parallel_builder.compile()
 
+if __name__ == "__main__":
+    parallel_workflow = build_graph()
 
-# Show workflow in terminal
-print("\nWorkflow Graph:")
-print(parallel_workflow.get_graph().draw_mermaid())
+    # Show workflow in terminal
+    print("\nWorkflow Graph:")
+    print(parallel_workflow.get_graph().draw_mermaid())
 
-# Invoke
-state = parallel_workflow.invoke({"topic": "Software Engineers"})
-print(state)
+    # Invoke
+    state = parallel_workflow.invoke({"topic": "Software Engineers"})
+    print(state)
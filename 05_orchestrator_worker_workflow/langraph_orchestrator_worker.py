@@ -1,11 +1,11 @@
 
 import operator
-from typing import Annotated, List, TypedDict
+from functools import lru_cache
+from typing import Annotated, Iterator, List, Optional, TypedDict
+from typing_extensions import Literal
 from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, SystemMessage
-from langgraph.types import Send
-from utils.llm_client import Claude3_7SonnetFactory
-from langgraph.graph import StateGraph, START, END
+from utils.llm_client import Claude3_7SonnetFactory, output_budget
 
 
 class Section(BaseModel):
@@ -17,11 +17,21 @@ class Sections(BaseModel):
     sections: List[Section] = Field(description="List of sections of the report report")
 
 
-llm = Claude3_7SonnetFactory().create_client()
+def get_llm():
+    """Bedrock client, created on first use so importing this module stays cheap"""
+    return Claude3_7SonnetFactory().create_client()
 
 
-# Augment the LLM with schema for structured output
-planner = llm.with_structured_output(Sections)
+@lru_cache(maxsize=None)
+def get_planner():
+    # Augment the LLM with schema for structured output
+    return get_llm().with_structured_output(Sections)
+
+
+@lru_cache(maxsize=None)
+def get_streaming_planner():
+    # Same schema, but the raw tool call is streamed so sections can be read as they are written
+    return get_llm().bind_tools([Sections], tool_choice="Sections")
 
 
 
@@ -30,47 +40,79 @@ class State(TypedDict):
     topic: str # Report topic
     sections: list[Section] # List of report sections
     completed_sections: Annotated[list, operator.add] # All workers write to this key in parallel
+    completed_indices: Annotated[list, operator.add] # Plan position of each completed section
     final_report: str # Final report
 
 
 # Worker state
 class WorkerState(TypedDict):
     section: Section 
+    index: int # Position of the section in the plan
     completed_sections: Annotated[list, operator.add]
+    completed_indices: Annotated[list, operator.add]
+
+
 
+def planner_messages(topic: str):
+    return [
+        SystemMessage(content="Generate a plan for the report"),
+        HumanMessage(content=f"Here is the topic of the report: {topic}")
+    ]
 
 
 # Nodes
+# The Sections plan
+output_budget("orchestrator", 2048)
+
+
 def orchestrator(state: State):
     """Orchestrator that generates a plan for the report"""
 
     # Generate queries
-    report_sections = planner.invoke([
-        SystemMessage(content="Generate a plan for the report"),
-        HumanMessage(content=f"Here is the topic of the report: {state['topic']}")
-    ])
+    report_sections = get_planner().invoke(planner_messages(state["topic"]))
 
     return {"sections" : report_sections.sections}
 
 
+# One report section
+output_budget("llm_worker", 4096)
+
+
 def llm_worker(state: WorkerState):
     """Worker writes a section of the report"""
+    from langgraph.config import get_stream_writer
 
-    # Generate the section
-    section = llm.invoke([
+    # Generate the section (the metadata tags its tokens when streaming)
+    section = get_llm().invoke([
         SystemMessage(content="Write a report section following the provided name and description. Include no preamble for each section. Use markdown formatting."),
         HumanMessage(content=f"Here is the section name: {state['section'].name} and the section description: {state['section'].description}")
-    ])
+    ], config={"metadata": {"section_index": state["index"], "section_name": state["section"].name}})
+
+    # Emit the finished section right away for stream_mode="custom" consumers
+    get_stream_writer()({"index": state["index"], "name": state["section"].name, "content": section.content})
 
     # Write the updated section to completed sections
-    return {"completed_sections": [section.content]}
+    return {"completed_sections": [section.content], "completed_indices": [state["index"]]}
+
+
+def estimate_section_size(state: WorkerState) -> int:
+    """Expected length of a section: a description covering more ground makes a longer section"""
+    return len(state["section"].description.split())
+
+
+def section_timed_out(state: WorkerState, error: BaseException):
+    """Stand-in for a section whose worker ran out of time, so the report still completes"""
+    content = f"## {state['section'].name}\n\n_This section could not be written in time._"
+    return {"completed_sections": [content], "completed_indices": [state["index"]]}
 
 
 def synthesizer(state: State):
     """Synthesize full report from the sections"""
 
-    # List of completed sections
+    # List of completed sections, in plan order (workers are scheduled longest first)
     completed_sections = state["completed_sections"]
+    if len(state.get("completed_indices") or []) == len(completed_sections):
+        completed_sections = [content for _, content in sorted(zip(state["completed_indices"], completed_sections), key=lambda pair: pair[0])]
 
     # Format completed section to str to use as context for final sections
     completed_report = "\n-----------\n".join(completed_sections)
@@ -85,46 +127,181 @@ def synthesizer(state: State):
 # Because orchestrator-worker workflows are common, LangGraph has the Send API to support this. It lets you dynamically create worker nodes and send each one a specific input. Each worker has its own state, and all worker outputs are written to a shared state key that is accessible to the orchestrator graph. This gives the orchestrator access to all worker output and allows it to synthesize them into a final output. As you can see below, we iterate over a list of sections and Send each to a worker node.
 
 # Conditional edge function to create llm_workers that each write a section of report
-def assign_worker(state: State):
+def assign_worker(state: State, scheduler=None):
     """Assign a worker to write a section of the report"""
+    from langgraph.types import Send
 
-    # Kick off section writing in parallel via Send() API
-    return [Send("llm_worker", {"section": section}) for section in state["sections"]]
+    payloads = [{"section": section, "index": index} for index, section in enumerate(state["sections"])]
+    if scheduler is not None:
+        # Longest sections first, with a bounded number in flight (utils/fanout.py)
+        return scheduler.sends("llm_worker", payloads)
 
-
-
-
-
-
-# Build workflow
-orchestrator_worker_builder = StateGraph(State)
-
-#Add the nodes
-orchestrator_worker_builder.add_node("orchestrator", orchestrator)
-orchestrator_worker_builder.add_node("llm_worker", llm_worker)
-orchestrator_worker_builder.add_node("synthesizer", synthesizer)
-
-# Add edges
-orchestrator_worker_builder.add_edge(START, "orchestrator")
-orchestrator_worker_builder.add_conditional_edges(
-    "orchestrator",
-    assign_worker,
-    ["llm_worker"]
-)
-orchestrator_worker_builder.add_edge("llm_worker", "synthesizer")
-orchestrator_worker_builder.add_edge("synthesizer", END)
-
-# Compile workflow
-orchestrator_worker_workflow = orchestrator_worker_builder.compile()
-
-
-# Show workflow in terminal
-print("\nWorkflow Graph:")
-print(orchestrator_worker_workflow.get_graph().draw_mermaid())
-
-
-
-# Invoke
-state = orchestrator_worker_workflow.invoke({"topic": "Create a report on Agentic RAG vs ReRanker RAG"})
-
-print(state)
+    # Kick off section writing in parallel via Send() API
+    return [Send("llm_worker", payload) for payload in payloads]
+
+
+# Pipelined dispatch
+
+# Send() can only start workers once the orchestrator node has returned, i.e. once the planner has
+# written the whole plan. In pipelined mode the orchestrator streams the planner's tool call instead,
+# parses the partial JSON as it arrives and starts a worker for every section the moment the planner
+# moves on to the next one, so the first sections are being written while the plan is still generated.
+
+def pipelined_orchestrator(state: State, scheduler=None):
+    """Orchestrator that starts a worker for each section as soon as the planner has written it"""
+    from contextvars import copy_context
+    from langchain_core.runnables import RunnableLambda
+    from langchain_core.utils.json import parse_partial_json
+    from utils.llm_client import get_executor
+
+    # Workers run as child runs tagged like the llm_worker node, for tracing, deadlines and token streaming
+    worker = RunnableLambda(scheduler.worker(llm_worker) if scheduler else llm_worker, name="llm_worker")
+    worker_config = {"metadata": {"langgraph_node": "llm_worker"}}
+    sections, futures = [], []
+
+    def dispatch(planned):
+        for index in range(len(sections), len(planned)):
+            sections.append(Section.model_validate(planned[index]))
+            futures.append(get_executor().submit(
+                copy_context().run, worker.invoke, {"section": sections[index], "index": index}, worker_config
+            ))
+
+    try:
+        args = ""
+        for chunk in get_streaming_planner().stream(planner_messages(state["topic"])):
+            for tool_call_chunk in chunk.tool_call_chunks:
+                args += tool_call_chunk.get("args") or ""
+            planned = (parse_partial_json(args) or {}).get("sections") if args else None
+            # The last parsed section may still be cut off mid-string
+            if isinstance(planned, list) and len(planned) > len(sections) + 1:
+                dispatch(planned[:-1])
+        dispatch(Sections.model_validate_json(args or "{}").sections)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    completed_sections = [future.result()["completed_sections"][0] for future in futures]
+    return {"sections": sections, "completed_sections": completed_sections, "completed_indices": list(range(len(sections)))}
+
+
+def build_graph(pipelined: bool = False, max_workers: Optional[int] = None, worker_deadline: Optional[float] = None):
+    """Compile the orchestrator-worker workflow
+
+    Workers are scheduled longest section first, at most ``max_workers`` at a
+    time (default ``LLM_MAX_CONCURRENCY``), and a worker whose model call
+    passes ``worker_deadline`` seconds (default: the ``llm_worker`` node
+    deadline) leaves a placeholder instead of failing the report. With
+    ``pipelined=True`` workers start while the planner is still generating
+    (see above).
+    """
+    from functools import partial
+    from langgraph.graph import StateGraph, START, END
+    import settings
+    from utils.fanout import FanOutScheduler
+    from utils.tracing import instrument
+
+    scheduler = FanOutScheduler(
+        max_workers or settings.LLM_MAX_CONCURRENCY,
+        size=estimate_section_size,
+        deadline=(lambda state: worker_deadline) if worker_deadline else None,
+        on_timeout=section_timed_out,
+    )
+
+    # Build workflow
+    orchestrator_worker_builder = StateGraph(State)
+
+    if pipelined:
+        orchestrator_worker_builder.add_node("orchestrator", partial(pipelined_orchestrator, scheduler=scheduler))
+        orchestrator_worker_builder.add_node("synthesizer", synthesizer)
+        orchestrator_worker_builder.add_edge(START, "orchestrator")
+        orchestrator_worker_builder.add_edge("orchestrator", "synthesizer")
+        orchestrator_worker_builder.add_edge("synthesizer", END)
+        return instrument(orchestrator_worker_builder.compile())
+
+    #Add the nodes
+    orchestrator_worker_builder.add_node("orchestrator", orchestrator)
+    orchestrator_worker_builder.add_node("llm_worker", scheduler.worker(llm_worker))
+    orchestrator_worker_builder.add_node("synthesizer", synthesizer)
+
+    # Add edges
+    orchestrator_worker_builder.add_edge(START, "orchestrator")
+    orchestrator_worker_builder.add_conditional_edges(
+        "orchestrator",
+        partial(assign_worker, scheduler=scheduler),
+        ["llm_worker"]
+    )
+    orchestrator_worker_builder.add_edge("llm_worker", "synthesizer")
+    orchestrator_worker_builder.add_edge("synthesizer", END)
+
+    # Compile workflow
+    return instrument(orchestrator_worker_builder.compile())
+
+
+def stream_report(topic: str, order: Literal["completion", "plan"] = "completion", tokens: bool = False, pipelined: bool = False) -> Iterator[dict]:
+    """Stream the report while the workers are still writing it.
+
+    Yields ``{"type": "plan", "sections": [...]}`` once the orchestrator is done,
+    then ``{"type": "section", "index", "name", "content"}`` for every finished
+    section and finally ``{"type": "report", "content"}``. With ``tokens=True``
+    ``{"type": "token", "index", "name", "content"}`` events are interleaved as
+    each worker generates.
+
+    ``order="completion"`` emits sections the moment they finish, so the first
+    output waits only for the fastest worker. ``order="plan"`` emits them in plan
+    order, holding a section back only until every earlier one has been
+    emitted; tokens of held-back sections are buffered the same way.
+
+    With ``pipelined=True`` (see :func:`build_graph`) the plan event only
+    comes once every section is written, so the first sections arrive before it.
+    """
+    stream_mode = ["updates", "custom", "messages"] if tokens else ["updates", "custom"]
+    next_index = 0
+    finished = {}
+    buffered_tokens = {}
+
+    for mode, chunk in build_graph(pipelined).stream({"topic": topic}, stream_mode=stream_mode):
+        if mode == "updates":
+            if "orchestrator" in chunk:
+                yield {"type": "plan", "sections": [section.name for section in chunk["orchestrator"]["sections"]]}
+            elif "synthesizer" in chunk:
+                yield {"type": "report", "content": chunk["synthesizer"]["final_report"]}
+            continue
+
+        if mode == "messages":
+            message, metadata = chunk
+            if "section_index" not in metadata or not isinstance(message.content, str) or not message.content:
+                continue
+            event = {"type": "token", "index": metadata["section_index"], "name": metadata["section_name"], "content": message.content}
+            if order == "completion" or event["index"] == next_index:
+                yield event
+            else:
+                buffered_tokens.setdefault(event["index"], []).append(event)
+            continue
+
+        event = {"type": "section", **chunk}
+        if order == "completion":
+            yield event
+            continue
+
+        # Plan order: release every section whose predecessors are all out
+        finished[event["index"]] = event
+        while next_index in finished:
+            yield finished.pop(next_index)
+            next_index += 1
+            yield from buffered_tokens.pop(next_index, [])
+
+
+if __name__ == "__main__":
+    orchestrator_worker_workflow = build_graph()
+
+    # Show workflow in terminal
+    print("\nWorkflow Graph:")
+    print(orchestrator_worker_workflow.get_graph().draw_mermaid())
+
+
+
+    # Invoke
+    state = orchestrator_worker_workflow.invoke({"topic": "Create a report on Agentic RAG vs ReRanker RAG"})
+
+    print(state)
@@ -1,11 +1,14 @@
 
-from typing import TypedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from functools import lru_cache
+from typing import Optional, Tuple, TypedDict
 from typing_extensions import Literal
 from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, SystemMessage
-from langgraph.graph import StateGraph, START, END
 
-from utils.llm_client import Claude3_7SonnetFactory
+from utils.cascade import model_cascade
+from utils.llm_client import Claude3_7SonnetFactory, output_budget
 
 
 class Evaluate(BaseModel):
@@ -13,10 +16,24 @@ class Evaluate(BaseModel):
     feedback: str = Field("If the joke is not funny provide feedback to improve it")
 
 
-llm = Claude3_7SonnetFactory().create_client()
+def get_llm():
+    """Bedrock client, created on first use so importing this module stays cheap"""
+    return Claude3_7SonnetFactory().create_client()
 
-#Augment the LLM with schema for structured output
-evaluator_llm = llm.with_structured_output(Evaluate)
+
+def usable_evaluation(evaluation: Optional[Evaluate]) -> bool:
+    """A valid grade, and real feedback when the joke is not funny"""
+    if evaluation is None or evaluation.grade not in ("funny", "not_funny"):
+        return False
+    feedback = evaluation.feedback.strip()
+    return evaluation.grade == "funny" or (bool(feedback) and feedback != Evaluate.model_fields["feedback"].default)
+
+
+@lru_cache(maxsize=None)
+def get_evaluator_llm():
+    #Augment the LLM with schema for structured output. With "evaluator" in
+    #LLM_CASCADE_NODES a smaller model grades first (see usable_evaluation)
+    return model_cascade("evaluator", lambda llm: llm.with_structured_output(Evaluate), accept=usable_evaluation)
 
 
 class State(TypedDict):
@@ -27,16 +44,19 @@ class State(TypedDict):
 
 
 #Nodes
+output_budget("joke_writer", 512)
+
+
 def joke_writer(state: State):
     """Write a joke about the topic"""
     
     if state.get('evaluation') and state['evaluation'].grade == "not_funny":
-        joke = llm.invoke([
+        joke = get_llm().invoke([
             SystemMessage(content=f"for the joke : {state['joke']}, feedback was: {state['evaluation'].feedback} for further improvement"),
             HumanMessage(content=f" improve the joke on Topic: {state['topic']}")
         ])
     else:    
-        joke = llm.invoke([
+        joke = get_llm().invoke([
             SystemMessage(content="Write a joke about the topic"),
             HumanMessage(content=f"Topic: {state['topic']}")
         ])
@@ -44,13 +64,91 @@ def joke_writer(state: State):
     return {"joke": joke.content, "retries": state.get('retries', -1) + 1}
 
 
-def evaluator(state: State):
-
-    evaluation = evaluator_llm.invoke([
+def evaluate_joke(joke: str) -> Evaluate:
+    return get_evaluator_llm().invoke([
         SystemMessage(content="Evaluate the joke by grading it as funny or not funny and provide feedback for further improvement if not funny. If there is no puchline in the joke, grade it as not funny and provide feedback to improve it."),
-        HumanMessage(content=f"Joke: {state['joke']}")
+        HumanMessage(content=f"Joke: {joke}")
     ])
-    return {"evaluation": evaluation}
+
+
+# A grade and a line of feedback
+output_budget("evaluator", 512)
+
+
+def evaluator(state: State):
+
+    return {"evaluation": evaluate_joke(state['joke'])}
+
+
+def write_candidate(topic: str, candidate: int, candidates: int, previous: Optional[Tuple[str, Evaluate]] = None) -> Tuple[str, Evaluate]:
+    """Write one candidate joke (or improve ``previous``) and evaluate it"""
+    # Each candidate gets its own instruction: identical requests would come
+    # back identical (and be served from the response cache)
+    angle = f"This is candidate {candidate + 1} of {candidates}; take a different angle from the others."
+    if previous:
+        joke, evaluation = previous
+        messages = [
+            SystemMessage(content=f"for the joke : {joke}, feedback was: {evaluation.feedback} for further improvement. {angle}"),
+            HumanMessage(content=f" improve the joke on Topic: {topic}")
+        ]
+    else:
+        messages = [
+            SystemMessage(content=f"Write a joke about the topic. {angle}"),
+            HumanMessage(content=f"Topic: {topic}")
+        ]
+    joke = get_llm().invoke(messages).content
+    return joke, evaluate_joke(joke)
+
+
+# Candidate jokes and their grades
+output_budget("best_of_n", 512)
+
+
+def make_best_of_n(candidates: int = 4, max_rounds: int = 2):
+    """Node that writes and grades ``candidates`` jokes at a time.
+
+    Every candidate is evaluated as soon as it is written, and the round stops
+    at the first ``funny`` grade without waiting for the rest. When none is
+    funny, the next round improves each candidate from its own feedback, for
+    at most ``max_rounds`` rounds. Wall-clock time is then about two calls per
+    round instead of two per attempt, at the cost of up to ``candidates``
+    times the tokens.
+
+    A candidate that fails (or gets no grade) is skipped, and starts afresh
+    in the next round; the node only fails when every candidate did.
+    """
+    def best_of_n(state: State):
+        previous = [None] * candidates
+        joke, evaluation, error = None, None, None
+        for round_ in range(max_rounds):
+            # Not a ``with`` block: leaving it would wait for the losing candidates
+            pool = ThreadPoolExecutor(max_workers=candidates, thread_name_prefix="best-of-n")
+            try:
+                pending = {
+                    pool.submit(copy_context().run, write_candidate, state['topic'], i, candidates, previous[i]): i
+                    for i in range(candidates)
+                }
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i = pending.pop(future)
+                        try:
+                            candidate = future.result()
+                            if candidate[1] is None:
+                                raise ValueError("The evaluator answered without a grade")
+                        except Exception as failure:
+                            error, previous[i] = failure, None
+                            continue
+                        joke, evaluation = previous[i] = candidate
+                        if evaluation.grade == "funny":
+                            return {"joke": joke, "evaluation": evaluation, "retries": round_}
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+        if evaluation is None:
+            raise error
+        return {"joke": joke, "evaluation": evaluation, "retries": max_rounds - 1}
+
+    return best_of_n
 
 
 #Conditional edge to decide whether to rewrite joke or not
@@ -63,38 +161,52 @@ def rewrite_joke(state: State):
         return "end"
     
 
-#Build workflow
-evaluator_optimizer_builder = StateGraph(State)
+def build_graph(candidates: Optional[int] = None, max_rounds: int = 2):
+    """Compile the evaluator-optimizer workflow
 
-#Add the nodes
-evaluator_optimizer_builder.add_node("joke_writer", joke_writer)
-evaluator_optimizer_builder.add_node("evaluator", evaluator)
+    With ``candidates`` set, the write/evaluate loop is replaced by a single
+    best-of-N node (see :func:`make_best_of_n`).
+    """
+    from langgraph.graph import StateGraph, START, END
+    from utils.tracing import instrument
 
-#Add edges
+    #Build workflow
+    evaluator_optimizer_builder = StateGraph(State)
 
-evaluator_optimizer_builder.add_edge(START, "joke_writer")
-evaluator_optimizer_builder.add_edge("joke_writer", "evaluator")
-evaluator_optimizer_builder.add_conditional_edges(
-    "evaluator",
-    rewrite_joke,
-    {
-        "joke_writer": "joke_writer",
-        "end": END
-    }
-)
+    if candidates:
+        evaluator_optimizer_builder.add_node("best_of_n", make_best_of_n(candidates, max_rounds))
+        evaluator_optimizer_builder.add_edge(START, "best_of_n")
+        evaluator_optimizer_builder.add_edge("best_of_n", END)
+        return instrument(evaluator_optimizer_builder.compile())
 
-#Compile workflow
-evaluator_optimizer_workflow = evaluator_optimizer_builder.compile()
+    #Add the nodes
+    evaluator_optimizer_builder.add_node("joke_writer", joke_writer)
+    evaluator_optimizer_builder.add_node("evaluator", evaluator)
 
-# Show workflow in terminal
-print("\nWorkflow Graph:")
-print(evaluator_optimizer_workflow.get_graph().draw_mermaid())
+    #Add edges
 
-# Invoke
-state = evaluator_optimizer_workflow.invoke({"topic": "indian cricket team"})
-print(state)
+    evaluator_optimizer_builder.add_edge(START, "joke_writer")
+    evaluator_optimizer_builder.add_edge("joke_writer", "evaluator")
+    evaluator_optimizer_builder.add_conditional_edges(
+        "evaluator",
+        rewrite_joke,
+        {
+            "joke_writer": "joke_writer",
+            "end": END
+        }
+    )
 
+    #Compile workflow
+    return instrument(evaluator_optimizer_builder.compile())
 
 
+if __name__ == "__main__":
+    evaluator_optimizer_workflow = build_graph()
 
+    # Show workflow in terminal
+    print("\nWorkflow Graph:")
+    print(evaluator_optimizer_workflow.get_graph().draw_mermaid())
 
+    # Invoke
+    state = evaluator_optimizer_workflow.invoke({"topic": "indian cricket team"})
+    print(state)
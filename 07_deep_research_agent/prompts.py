@@ -1,12 +1,11 @@
 
 
-clarify_with_user_instructions="""
-These are the messages that have been exchanged so far from the user asking for the report:
-<Messages>
-{messages}
-</Messages>
+# Each prompt is a static instruction block followed by the conversation and
+# today's date (see ``messages_prompt``/``date_prompt``), so the instructions
+# form an unchanging prefix that Bedrock can serve from its prompt cache.
 
-Today's date is {date}.
+clarify_with_user_instructions="""
+You will be given the messages that have been exchanged so far from the user asking for the report, followed by today's date.
 
 Assess whether you need to ask a clarifying question, or if the user has already provided enough information for you to start research.
 IMPORTANT: If you can see in the messages history that you have already asked a clarifying question, you almost always do not need to ask another one. Only ask another question if ABSOLUTELY NECESSARY.
@@ -40,16 +39,9 @@ For the verification message when no clarification is needed:
 - Keep the message concise and professional
 """
 
-transform_messages_into_research_topic_prompt = """You will be given a set of messages that have been exchanged so far between yourself and the user. 
+transform_messages_into_research_topic_prompt = """You will be given a set of messages that have been exchanged so far between yourself and the user, followed by today's date. 
 Your job is to translate these messages into a more detailed and concrete research question that will be used to guide the research.
 
-The messages that have been exchanged so far between yourself and the user are:
-<Messages>
-{messages}
-</Messages>
-
-Today's date is {date}.
-
 You will return a single research question that will be used to guide the research.
 
 Guidelines:
@@ -81,4 +73,11 @@ Guidelines:
 - For academic or scientific queries, prefer linking directly to the original paper or official journal publication rather than survey papers or secondary summaries.
 - For people, try linking directly to their LinkedIn profile, or their personal website if they have one.
 - If the query is in a specific language, prioritize sources published in that language.
-"""
\ No newline at end of file
+"""
+
+messages_prompt = """The messages that have been exchanged so far are:
+<Messages>"""
+
+date_prompt = """</Messages>
+
+Today's date is {date}."""
@@ -0,0 +1,406 @@
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.llm_client import current_deadline
+from utils.prompt_cache import CACHE_READ_HEADER, CACHE_WRITE_HEADER, MIN_CACHEABLE_TOKENS
+from utils.tokens import estimate_tokens
+
+_WORDS = (
+    "agent graph model token latency prompt cache stream router worker section report joke poem story "
+    "topic engineer research query budget node state memory batch signal pipeline result answer draft "
+    "review feedback summary context window request response deadline throughput quorum"
+).split()
+
+
+class LatencyModel:
+    """Service time of a fake model call.
+
+    Time to first token is lognormal around ``ttft_ms`` (``ttft_sigma`` 0
+    makes it fixed), output length is uniform in ``output_tokens`` and every
+    further token takes ``per_token_ms``.
+    """
+
+    def __init__(
+        self,
+        ttft_ms: float = 400.0,
+        ttft_sigma: float = 0.4,
+        per_token_ms: float = 15.0,
+        output_tokens: Tuple[int, int] = (40, 400),
+    ):
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.per_token_ms = per_token_ms
+        self.output_tokens = output_tokens
+
+    def sample(self, rng: random.Random) -> Tuple[float, float, int]:
+        """``(time to first token, seconds per token, output tokens)`` for one call."""
+        ttft = self.ttft_ms * math.exp(rng.gauss(0.0, self.ttft_sigma)) if self.ttft_sigma else self.ttft_ms
+        return ttft / 1000, self.per_token_ms / 1000, rng.randint(*self.output_tokens)
+
+
+# Named latency profiles: "zero" isolates Python-side overhead, "bedrock"
+# roughly matches Claude 3.7 Sonnet on on-demand Bedrock.
+PROFILES = {
+    "zero": LatencyModel(ttft_ms=0.0, ttft_sigma=0.0, per_token_ms=0.0, output_tokens=(40, 400)),
+    "fast": LatencyModel(ttft_ms=40.0, ttft_sigma=0.3, per_token_ms=0.5, output_tokens=(40, 200)),
+    "bedrock": LatencyModel(ttft_ms=600.0, ttft_sigma=0.5, per_token_ms=14.0, output_tokens=(60, 600)),
+}
+
+
+def sample_from_schema(schema: Dict[str, Any], rng: random.Random, defs: Optional[Dict[str, Any]] = None) -> Any:
+    """A random value that validates against a (tool input) JSON schema."""
+    defs = schema.get("$defs", {}) if defs is None else defs
+    if "$ref" in schema:
+        return sample_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], rng, defs)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "const" in schema:
+        return schema["const"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"]
+            return sample_from_schema(options[0], rng, defs)
+
+    kind = schema.get("type", "string")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "object":
+        return {name: sample_from_schema(field, rng, defs) for name, field in schema.get("properties", {}).items()}
+    if kind == "array":
+        low = schema.get("minItems", 2)
+        count = rng.randint(low, max(low, min(schema.get("maxItems", 5), 5)))
+        return [sample_from_schema(schema.get("items", {}), rng, defs) for _ in range(count)]
+    if kind == "integer":
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 100))
+    if kind == "number":
+        return round(rng.uniform(schema.get("minimum", 0.0), schema.get("maximum", 1.0)), 3)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return _text(rng, rng.randint(3, 12))
+
+
+def _text(rng: random.Random, tokens: int) -> str:
+    words = [rng.choice(_WORDS) for _ in range(max(1, tokens))]
+    # Roughly every other response ends on a punchline, like the real model's jokes
+    return " ".join(words).capitalize() + rng.choice(".!?.")
+
+
+def _request_key(operation: str, kwargs: Dict[str, Any]) -> str:
+    return hashlib.sha256(f"{operation}\0{kwargs.get('modelId')}\0{kwargs['body']}".encode()).hexdigest()
+
+
+class _Events:
+    """The part of botocore's event system that ``register_response_hooks`` uses."""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[..., Any]]] = defaultdict(list)
+
+    def register(self, event_name: str, handler: Callable[..., Any], **kwargs: Any) -> None:
+        self._handlers[event_name].append(handler)
+
+    def emit(self, event_name: str, **kwargs: Any) -> None:
+        for handler in self._handlers[event_name]:
+            handler(**kwargs)
+
+
+class ThrottlingError(Exception):
+    """Shaped like botocore's ``ClientError`` for a Bedrock ``ThrottlingException``."""
+
+    def __init__(self, operation: str):
+        self.response = {"Error": {"Code": "ThrottlingException", "Message": "Too many requests, please wait before trying again."}}
+        super().__init__(f"An error occurred (ThrottlingException) when calling the {operation} operation: Too many requests")
+
+
+class ReadTimeoutError(Exception):
+    """Stands in for botocore's ``ReadTimeoutError``."""
+
+
+class FakeBedrockRuntime:
+    """Local stand-in for a boto3 ``bedrock-runtime`` client (Anthropic models).
+
+    Answers ``invoke_model`` and ``invoke_model_with_response_stream`` the way
+    Bedrock does, so everything above the socket (langchain_aws, the rate
+    limiter, prompt-cache accounting, tracing) runs for real:
+
+    * text responses of ``latency``-sampled length, streamed token by token;
+    * a ``tool_use`` block with arguments generated from the tool's input
+      schema whenever tools are bound (structured output, tool calling);
+    * prompt caching: a ``cache_control`` prefix is written on first sight and
+      read afterwards, reported through the usual response headers;
+    * throttling, for a ``throttle_rate`` share of calls and for every call
+      above ``capacity`` in flight, and read timeouts for non-streamed calls
+      that take longer than the caller's deadline;
+    * replay of responses recorded by :class:`RecordingRuntime`, with their
+      recorded timings unless ``replay_timing`` is off (requests that were
+      not recorded get a synthetic answer).
+
+    Every choice comes from a random generator seeded with ``seed``, the request
+    and how many times that request was seen, so runs are reproducible
+    regardless of thread scheduling.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        throttle_rate: float = 0.0,
+        capacity: Optional[int] = None,
+        recordings: Optional[str] = None,
+        seed: int = 0,
+        region: str = "us-east-1",
+        replay_timing: bool = True,
+    ):
+        self.latency = latency or PROFILES["fast"]
+        self.throttle_rate = throttle_rate
+        self.capacity = capacity
+        self.seed = seed
+        self.replay_timing = replay_timing
+        self.meta = SimpleNamespace(events=_Events(), region_name=region)
+
+        self._lock = threading.Lock()
+        self._seen: Counter = Counter()
+        self._cached_prefixes: set = set()
+        self._in_flight = 0
+        self._counters: Counter = Counter()
+        self._recordings: Dict[str, Dict[str, Any]] = {}
+        if recordings:
+            with open(recordings) as file:
+                for line in file:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._recordings.setdefault(record["key"], record)
+
+    # botocore client API
+
+    def invoke_model(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._call("InvokeModel", kwargs, stream=False)
+
+    def invoke_model_with_response_stream(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._call("InvokeModelWithResponseStream", kwargs, stream=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Calls served, by outcome."""
+        with self._lock:
+            return dict(self._counters)
+
+    def _call(self, operation: str, kwargs: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        key = _request_key(operation, kwargs)
+        with self._lock:
+            occurrence = self._seen[key]
+            self._seen[key] += 1
+            self._in_flight += 1
+            over_capacity = self.capacity is not None and self._in_flight > self.capacity
+        try:
+            rng = random.Random(f"{self.seed}:{key}:{occurrence}")
+            if over_capacity or rng.random() < self.throttle_rate:
+                # Bedrock rejects throttled calls quickly, before any generation
+                time.sleep(min(0.05, self.latency.ttft_ms / 1000))
+                self._count("throttled")
+                raise ThrottlingError(operation)
+
+            recorded = self._recordings.get(key)
+            if recorded is not None:
+                self._count("replayed")
+                response = self._replay(recorded, stream)
+            else:
+                self._count("streamed" if stream else "invoked")
+                response = self._synthesize(json.loads(kwargs["body"]), rng, stream)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        self.meta.events.emit(f"after-call.bedrock-runtime.{operation}", parsed=response, model=None)
+        return response
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _prompt_cache(self, body: Dict[str, Any]) -> Tuple[int, int]:
+        """``(cache_read, cache_write)`` tokens for the request's cache checkpoints."""
+        blocks = [{"text": body.get("system", "")}] if isinstance(body.get("system"), str) else list(body.get("system") or [])
+        for message in body.get("messages", []):
+            content = message["content"]
+            blocks.extend([{"text": content}] if isinstance(content, str) else content)
+        last = max((i for i, block in enumerate(blocks) if "cache_control" in block), default=None)
+        if last is None:
+            return 0, 0
+        prefix = json.dumps(blocks[: last + 1], sort_keys=True)
+        tokens = estimate_tokens(prefix)
+        if tokens < MIN_CACHEABLE_TOKENS:
+            return 0, 0
+        digest = hashlib.sha256(prefix.encode()).digest()
+        with self._lock:
+            hit = digest in self._cached_prefixes
+            self._cached_prefixes.add(digest)
+        return (tokens, 0) if hit else (0, tokens)
+
+    def _synthesize(self, body: Dict[str, Any], rng: random.Random, stream: bool) -> Dict[str, Any]:
+        ttft, per_token, output_tokens = self.latency.sample(rng)
+        truncated = output_tokens > body.get("max_tokens", output_tokens)
+        output_tokens = min(output_tokens, body.get("max_tokens", output_tokens))
+        cache_read, cache_write = self._prompt_cache(body)
+        input_tokens = max(1, estimate_tokens(json.dumps(body)) - cache_read - cache_write)
+
+        tools = body.get("tools") or []
+        if tools:
+            choice = body.get("tool_choice") or {}
+            tool = next((t for t in tools if t["name"] == choice.get("name")), tools[0])
+            block = {
+                "type": "tool_use",
+                "id": f"toolu_fake_{rng.getrandbits(64):016x}",
+                "name": tool["name"],
+                "input": sample_from_schema(tool.get("input_schema", {}), rng),
+            }
+            pieces = _split(json.dumps(block["input"]), max(1, output_tokens // 8))
+            stop_reason = "tool_use"
+        else:
+            block = {"type": "text", "text": _text(rng, output_tokens)}
+            pieces = [word + " " for word in block["text"].split(" ")]
+            pieces[-1] = pieces[-1].rstrip()
+            stop_reason = "max_tokens" if truncated else "end_turn"
+
+        headers = {
+            "x-amzn-bedrock-input-token-count": str(input_tokens),
+            "x-amzn-bedrock-output-token-count": str(output_tokens),
+            CACHE_READ_HEADER: str(cache_read),
+            CACHE_WRITE_HEADER: str(cache_write),
+        }
+        # Cached prefix tokens skip most of the prefill, which dominates time to first token
+        prompt_tokens = input_tokens + cache_read + cache_write
+        ttft *= 1 - 0.8 * cache_read / prompt_tokens
+        if not stream:
+            # The whole body arrives at once, so the read timeout bounds the entire call
+            read_timeout = current_deadline()
+            if read_timeout and ttft + per_token * output_tokens > read_timeout:
+                time.sleep(read_timeout)
+                raise ReadTimeoutError(f"Read timeout on endpoint URL (read timeout={read_timeout:g})")
+            time.sleep(ttft + per_token * output_tokens)
+            message = {
+                "id": f"msg_fake_{rng.getrandbits(64):016x}",
+                "type": "message",
+                "role": "assistant",
+                "model": "fake",
+                "content": [block],
+                "stop_reason": stop_reason,
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            }
+            return {"body": io.BytesIO(json.dumps(message).encode()), "ResponseMetadata": {"HTTPHeaders": headers}}
+
+        time.sleep(ttft)
+        events = _stream_events(block, pieces, stop_reason, input_tokens, output_tokens, ttft)
+        delay = per_token * output_tokens / len(pieces)
+        return {"body": _paced(events, [0.0, 0.0] + [delay] * len(pieces) + [0.0] * 3), "ResponseMetadata": {"HTTPHeaders": headers}}
+
+    def _replay(self, record: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        headers = record.get("headers", {})
+        if not stream:
+            if self.replay_timing:
+                time.sleep(record.get("latency", 0.0))
+            return {"body": io.BytesIO(record["body"].encode()), "ResponseMetadata": {"HTTPHeaders": headers}}
+        events = [{"chunk": {"bytes": event.encode()}} for event in record["events"]]
+        if self.replay_timing:
+            time.sleep(record.get("ttft", 0.0))
+        gaps = record.get("gaps") if self.replay_timing else None
+        return {"body": _paced(events, gaps or [0.0] * len(events)), "ResponseMetadata": {"HTTPHeaders": headers}}
+
+
+def _split(text: str, parts: int) -> List[str]:
+    size = max(1, math.ceil(len(text) / parts))
+    return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _stream_events(block, pieces, stop_reason, input_tokens, output_tokens, ttft) -> List[Dict[str, Any]]:
+    """The Anthropic messages stream for one content block, as Bedrock event-stream chunks."""
+    if block["type"] == "text":
+        start = {"type": "text", "text": ""}
+        deltas = [{"type": "text_delta", "text": piece} for piece in pieces]
+    else:
+        start = {"type": "tool_use", "id": block["id"], "name": block["name"], "input": {}}
+        deltas = [{"type": "input_json_delta", "partial_json": piece} for piece in pieces]
+    events = [
+        {"type": "message_start", "message": {"role": "assistant", "content": [], "usage": {"input_tokens": input_tokens, "output_tokens": 1}}},
+        {"type": "content_block_start", "index": 0, "content_block": start},
+        *({"type": "content_block_delta", "index": 0, "delta": delta} for delta in deltas),
+        {"type": "content_block_stop", "index": 0},
+        {"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None}, "usage": {"output_tokens": output_tokens}},
+        {
+            "type": "message_stop",
+            "amazon-bedrock-invocationMetrics": {
+                "inputTokenCount": input_tokens,
+                "outputTokenCount": output_tokens,
+                "firstByteLatency": int(ttft * 1000),
+            },
+        },
+    ]
+    return [{"chunk": {"bytes": json.dumps(event).encode()}} for event in events]
+
+
+def _paced(events: List[Dict[str, Any]], gaps: List[float]) -> Iterator[Dict[str, Any]]:
+    for event, gap in zip(events, gaps):
+        if gap:
+            time.sleep(gap)
+        yield event
+
+
+class RecordingRuntime:
+    """Wraps a real ``bedrock-runtime`` client and appends every response to a JSONL file.
+
+    The file can be replayed with ``FakeBedrockRuntime(recordings=path)``.
+    Streams are recorded with the gap before each event, so replays keep
+    their real time to first token and token rate.
+    """
+
+    def __init__(self, client: Any, path: str):
+        self.client = client
+        self.path = path
+        self.meta = client.meta
+        self._lock = threading.Lock()
+
+    def invoke_model(self, **kwargs: Any) -> Dict[str, Any]:
+        started = time.perf_counter()
+        response = self.client.invoke_model(**kwargs)
+        body = response["body"].read().decode()
+        self._write({
+            "key": _request_key("InvokeModel", kwargs),
+            "headers": response["ResponseMetadata"]["HTTPHeaders"],
+            "latency": time.perf_counter() - started,
+            "body": body,
+        })
+        return {**response, "body": io.BytesIO(body.encode())}
+
+    def invoke_model_with_response_stream(self, **kwargs: Any) -> Dict[str, Any]:
+        started = time.perf_counter()
+        response = self.client.invoke_model_with_response_stream(**kwargs)
+        record = {
+            "key": _request_key("InvokeModelWithResponseStream", kwargs),
+            "headers": response["ResponseMetadata"]["HTTPHeaders"],
+            "ttft": time.perf_counter() - started,
+        }
+        return {**response, "body": self._record_stream(response["body"], record)}
+
+    def _record_stream(self, stream, record: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        events, gaps = [], []
+        last = time.perf_counter()
+        for event in stream:
+            if "chunk" in event:
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+                events.append(event["chunk"]["bytes"].decode())
+                # langchain_aws stops reading at message_stop, so this generator is never exhausted
+                if json.loads(events[-1]).get("type") == "message_stop":
+                    self._write({**record, "events": events, "gaps": gaps})
+            yield event
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record) + "\n"
+        with self._lock, open(self.path, "a") as file:
+            file.write(line)
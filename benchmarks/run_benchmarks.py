@@ -0,0 +1,241 @@
+"""Benchmark every workflow offline against a fake Bedrock backend.
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --profile bedrock --workflows chain parallel
+    python -m benchmarks.run_benchmarks --throttle-rate 0.05 --json results.json
+    python -m benchmarks.run_benchmarks --baseline results.json --tolerance 0.2
+    python -m benchmarks.run_benchmarks --record recordings.jsonl      # real Bedrock, once
+    python -m benchmarks.run_benchmarks --replay recordings.jsonl
+
+For every workflow it reports end-to-end p50/p95/p99 latency and throughput
+at each concurrency level, and the Python-side time per graph node, measured
+against a zero-latency backend (so what is left is LangGraph, LangChain,
+langchain_aws, the rate limiter and the tracing itself). With ``--baseline``
+the run fails when a p95 or a node's overhead regressed by more than
+``--tolerance``.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import settings
+
+from benchmarks.fake_bedrock import PROFILES, FakeBedrockRuntime, RecordingRuntime
+from run_workflow import WORKFLOWS
+
+INPUTS = {
+    "chain": {"topic": "Software Engineers"},
+    "routing": {"input": "Write me a poem about stock market and life of a software engineer"},
+    "parallel": {"topic": "Software Engineers"},
+    "orchestrator_worker": {"topic": "Create a report on Agentic RAG vs ReRanker RAG"},
+    "evaluator_optimizer": {"topic": "Software Engineers"},
+    "scope": {"messages": [{"role": "user", "content": "I want to research the best coffee shops in San Francisco."}]},
+}
+
+CONCURRENCY = (1, 8, 64)
+
+
+def _augmented(config: Dict[str, Any]) -> None:
+    # 01 has no graph: its structured output, tool calling and memory examples in one run
+    module = importlib.import_module("01_augmented_llm.langraph_augmented_llm")
+    llm = module.get_llm()
+    llm.with_structured_output(module.SearchQuery).invoke("How does Calcium CT score relate to high cholesterol?", config)
+    llm.bind_tools([module.multiply]).invoke("What is 2 times 3?", config)
+    memory = module.ConversationMemory()
+    memory.add_message("user", "My name is Alice.")
+    memory.add_message("assistant", "Nice to meet you, Alice!")
+    llm.invoke(module.format_with_memory("What's my name?", memory), config)
+
+
+def scenarios(names: List[str]) -> Dict[str, Callable[[Dict[str, Any]], Any]]:
+    """One callable per workflow that runs it once with the given run config."""
+    runs = {}
+    for name in names:
+        if name == "augmented":
+            runs[name] = _augmented
+        else:
+            graph = importlib.import_module(WORKFLOWS[name]).build_graph()
+            runs[name] = lambda config, graph=graph, state=INPUTS[name]: graph.invoke(state, config)
+    return runs
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class _SpanCollector:
+    """A tracer that keeps spans in memory (see ``utils.tracing.Tracer``)."""
+
+    def __init__(self):
+        from utils.tracing import TracingCallbackHandler
+
+        self.spans: List[Dict[str, Any]] = []
+        self.handler = TracingCallbackHandler(self)
+
+    def record(self, span: Dict[str, Any]) -> None:
+        self.spans.append(span)
+
+
+def measure_load(run: Callable[[Dict[str, Any]], Any], concurrency: int, requests: int) -> Dict[str, float]:
+    """Latency percentiles (ms) and throughput of ``requests`` runs, ``concurrency`` at a time."""
+    latencies: List[float] = []
+    errors: List[BaseException] = []
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            run({})
+        except Exception as error:
+            errors.append(error)
+            return
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "throughput": len(latencies) / elapsed,
+    }
+
+
+def measure_overhead(run: Callable[[Dict[str, Any]], Any], repeats: int) -> Dict[str, Dict[str, float]]:
+    """Mean and p95 time (ms) per node and per model call over ``repeats`` sequential runs."""
+    collector = _SpanCollector()
+    # The first run pays for imports and client construction
+    run({})
+    for _ in range(repeats):
+        run({"callbacks": [collector.handler]})
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for span in collector.spans:
+        durations[f"{span['kind']}:{span.get('node') or 'none'}"].append(span["duration"] * 1000)
+    return {
+        key: {"count": len(values), "mean": sum(values) / len(values), "p95": percentile(values, 0.95)}
+        for key, values in sorted(durations.items())
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Every p95 latency and mean node overhead that got worse than ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for workflow, result in results.items():
+        base = baseline.get(workflow)
+        if base is None:
+            continue
+        for level, load in result["load"].items():
+            before = base["load"].get(level, {}).get("p95")
+            if before and load["p95"] > before * (1 + tolerance):
+                regressions.append(f"{workflow} c={level} p95 {before:.1f} -> {load['p95']:.1f} ms")
+        for key, overhead in result["overhead"].items():
+            before = base["overhead"].get(key, {}).get("mean")
+            # Sub-millisecond spans are mostly noise
+            if before and overhead["mean"] > max(before * (1 + tolerance), before + 1.0):
+                regressions.append(f"{workflow} {key} overhead {before:.2f} -> {overhead['mean']:.2f} ms")
+    return regressions
+
+
+def _use_backend(factory: Callable[[str], Any]) -> None:
+    from utils.llm_client import get_client_registry
+
+    get_client_registry().set_runtime_client_factory(factory)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    names = ["augmented", *WORKFLOWS]
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_benchmarks", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workflows", nargs="+", choices=names, default=names, help="workflows to benchmark")
+    parser.add_argument("--profile", choices=list(PROFILES), default="fast", help="latency profile of the fake model")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(CONCURRENCY), help="concurrency levels")
+    parser.add_argument("--requests", type=int, default=16, help="runs per level (at least the concurrency)")
+    parser.add_argument("--overhead-runs", type=int, default=20, help="sequential zero-latency runs for per-node overhead")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of calls the fake throttles")
+    parser.add_argument("--capacity", type=int, help="throttle calls above this many in flight")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", metavar="PATH", help="serve responses recorded with --record")
+    parser.add_argument("--record", metavar="PATH", help="run once per workflow against real Bedrock, recording responses")
+    parser.add_argument("--json", metavar="PATH", help="write the results here")
+    parser.add_argument("--baseline", metavar="PATH", help="fail on regressions against these results")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 20%%)")
+    args = parser.parse_args(argv)
+
+    # langchain_aws logs a traceback for every throttled call before the limiter retries it
+    logging.getLogger("langchain_aws").setLevel(logging.CRITICAL)
+    # Measure the workflows, not the response cache, and keep limiter state away from real runs
+    settings.LLM_CACHE_PATH = None
+    settings.TRACE_PATH = settings.METRICS_PORT = None
+    settings.LLM_RATE_LIMIT_STATE_PATH = os.path.join(tempfile.mkdtemp(prefix="benchmarks-"), "rate_limits.json")
+
+    if args.record:
+        import boto3
+
+        from utils.llm_client import get_bedrock_config
+
+        session = boto3.Session()
+        _use_backend(lambda region: RecordingRuntime(session.client("bedrock-runtime", region_name=region, config=get_bedrock_config()), args.record))
+        for name, run in scenarios(args.workflows).items():
+            run({})
+            print(f"recorded {name}")
+        return 0
+
+    backends: List[FakeBedrockRuntime] = []
+
+    def fake(region: str) -> FakeBedrockRuntime:
+        backend = FakeBedrockRuntime(PROFILES["zero"], recordings=args.replay, seed=args.seed, region=region, replay_timing=False)
+        backends.append(backend)
+        return backend
+
+    # One backend for both passes: some workflows keep their clients for the whole process
+    _use_backend(fake)
+    runs = scenarios(args.workflows)
+    results: Dict[str, Any] = {name: {"overhead": measure_overhead(run, args.overhead_runs)} for name, run in runs.items()}
+
+    for backend in backends:
+        backend.latency = PROFILES[args.profile]
+        backend.throttle_rate, backend.capacity, backend.replay_timing = args.throttle_rate, args.capacity, True
+    for name, run in runs.items():
+        results[name]["load"] = {
+            str(level): measure_load(run, level, max(args.requests, level)) for level in args.concurrency
+        }
+
+    calls: Dict[str, int] = defaultdict(int)
+    for backend in backends:
+        for outcome, count in backend.stats().items():
+            calls[outcome] += count
+
+    print(f"profile: {args.profile}, fake model calls: {dict(calls)}\n")
+    print(f"{'workflow':<22}{'conc':>6}{'runs':>6}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'runs/s':>10}")
+    for name, result in results.items():
+        for level, load in result["load"].items():
+            print(f"{name:<22}{level:>6}{load['requests']:>6}{load['errors']:>8}{load['p50']:>10.1f}{load['p95']:>10.1f}{load['p99']:>10.1f}{load['throughput']:>10.2f}")
+    print(f"\n{'workflow':<22}{'span (zero-latency model)':<40}{'count':>8}{'mean ms':>10}{'p95 ms':>10}")
+    for name, result in results.items():
+        for key, overhead in result["overhead"].items():
+            print(f"{name:<22}{key:<40}{overhead['count']:>8}{overhead['mean']:>10.2f}{overhead['p95']:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        print("\n" + ("\n".join(f"REGRESSION {line}" for line in regressions) if regressions else "no regressions"))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
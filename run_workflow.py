@@ -0,0 +1,234 @@
+"""Run any workflow in this repo by name on JSON input.
+
+    python -m run_workflow --list
+    python -m run_workflow parallel '{"topic": "Software Engineers"}'
+    echo '{"input": "Write me a poem about the sea"}' | python -m run_workflow routing
+    python -m run_workflow --mermaid orchestrator_worker
+    python -m run_workflow scope --thread-id coffee '{"messages": [{"role": "user", "content": "Best coffee in SF"}]}'
+    python -m run_workflow --check-startup
+    python -m run_workflow parallel --batch inputs.jsonl --output results.jsonl --processes 4
+
+Only the standard library is imported up front. A workflow module is imported
+when it is selected, and LangGraph/Bedrock are loaded when its graph is built
+and its first node calls the model.
+"""
+import argparse
+import importlib
+import inspect
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+WORKFLOWS = {
+    "chain": "02_prompt_chaining_workflow.langraph_prompt_chaining",
+    "routing": "03_routing_workflow.langraph_routing",
+    "parallel": "04_parallel_workflow.langraph_parallel",
+    "orchestrator_worker": "05_orchestrator_worker_workflow.langraph_orchestrator_worker",
+    "evaluator_optimizer": "06_evaluator_optimizer_workflow.langraph_evaluator_optimizer",
+    "scope": "07_deep_research_agent.scope.deep_research_scope_agent",
+}
+
+# Cold-start target: importing every workflow module, in a fresh interpreter,
+# must finish within this budget and must not load the Bedrock client stack.
+COLD_START_BUDGET_MS = 1000
+CLIENT_STACK_MODULES = ("langchain_aws", "boto3", "botocore")
+
+
+def load_workflow(name: str):
+    """Import the module that defines workflow ``name``"""
+    if name not in WORKFLOWS:
+        raise KeyError(f"Unknown workflow {name!r}, expected one of: {', '.join(WORKFLOWS)}")
+    return importlib.import_module(WORKFLOWS[name])
+
+
+def build_graph(name: str, **kwargs):
+    """Compile workflow ``name``"""
+    return load_workflow(name).build_graph(**kwargs)
+
+
+def _to_json(value):
+    # Pydantic schemas and LangChain messages both support model_dump()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+# The graph of a batch worker process, built once by _init_batch_worker
+_batch_graph = None
+
+
+def _init_batch_worker(name: str) -> None:
+    global _batch_graph
+    _batch_graph = build_graph(name)
+
+
+def _run_batch_chunk(chunk: List[Tuple[int, Any]], concurrency: int) -> List[Tuple[str, bool]]:
+    """Run ``(index, input)`` pairs in a worker process, ``concurrency`` at a time.
+
+    Returns one ``(JSON line, failed)`` pair per input.
+    """
+    import asyncio
+
+    async def run():
+        return await _batch_graph.abatch(
+            [state for _, state in chunk], {"max_concurrency": concurrency}, return_exceptions=True
+        )
+
+    lines = []
+    for (index, _), result in zip(chunk, asyncio.run(run())):
+        if isinstance(result, Exception):
+            record = {"index": index, "error": f"{type(result).__name__}: {result}"}
+        else:
+            record = {"index": index, "output": result}
+        lines.append((json.dumps(record, default=_to_json), "error" in record))
+    return lines
+
+
+def batch_ledger(path: str) -> Set[int]:
+    """Indices of the inputs that already have a result in ``path``.
+
+    The results file is the ledger: a line is only written once its input
+    has finished. A line cut short by a crash is dropped, and an input that
+    failed counts as done only once a later line has its output.
+    """
+    done: Set[int] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as file:
+        data = file.read()
+        # Drop a partial last line so new results start on a line of their own
+        file.truncate(data.rfind(b"\n") + 1)
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "error" in record:
+            done.discard(record["index"])
+        else:
+            done.add(record["index"])
+    return done
+
+
+def run_batch(
+    name: str,
+    input_path: str,
+    output_path: str,
+    processes: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> Dict[str, int]:
+    """Run workflow ``name`` on every line of a JSONL file, resuming from ``output_path``.
+
+    Inputs are sharded into chunks across ``processes`` worker processes,
+    and each worker runs ``concurrency`` graphs at a time with ``abatch``.
+    Results are appended to ``output_path`` as ``{"index", "output"}`` or
+    ``{"index", "error"}`` lines (``index`` is the input's line number) as
+    soon as their chunk finishes, so a crashed or interrupted run picks up
+    where it stopped, and failed inputs are retried. Workers share the rate
+    limiter state (``LLM_RATE_LIMIT_STATE_PATH``) and the response cache
+    (``LLM_CACHE_PATH``), which are both safe to use from several processes.
+    """
+    import settings
+
+    processes = processes or min(4, os.cpu_count() or 1)
+    # Together the workers keep about as many calls in flight as one process would
+    concurrency = concurrency or max(1, settings.LLM_MAX_CONCURRENCY // processes)
+    chunk_size = chunk_size or concurrency
+
+    done = batch_ledger(output_path)
+    with open(input_path) as file:
+        pending = [(index, json.loads(line)) for index, line in enumerate(file) if line.strip() and index not in done]
+    chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+
+    counts = {"skipped": len(done), "succeeded": 0, "failed": 0}
+    with open(output_path, "a") as output, ProcessPoolExecutor(processes, initializer=_init_batch_worker, initargs=(name,)) as pool:
+        futures = [pool.submit(_run_batch_chunk, chunk, concurrency) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                lines = future.result()
+                output.write("".join(line + "\n" for line, _ in lines))
+                output.flush()
+                os.fsync(output.fileno())
+                for _, failed in lines:
+                    counts["failed" if failed else "succeeded"] += 1
+                print(f"{counts['succeeded'] + counts['failed']}/{len(pending)} inputs, {counts['failed']} failed", file=sys.stderr)
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+    return counts
+
+
+def check_startup() -> bool:
+    """Import every workflow module and compare the cost against the cold-start target"""
+    total_ms = 0.0
+    for name, module in WORKFLOWS.items():
+        started = time.perf_counter()
+        importlib.import_module(module)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        total_ms += elapsed_ms
+        print(f"{name:<22}{elapsed_ms:8.1f} ms")
+
+    loaded = [module for module in CLIENT_STACK_MODULES if module in sys.modules]
+    ok = total_ms <= COLD_START_BUDGET_MS and not loaded
+    print(f"{'total':<22}{total_ms:8.1f} ms (budget {COLD_START_BUDGET_MS} ms)")
+    print(f"langgraph loaded: {'langgraph' in sys.modules}")
+    print(f"client stack loaded: {', '.join(loaded) or 'no'}")
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m run_workflow", description="Run a workflow by name on JSON input.")
+    parser.add_argument("workflow", nargs="?", choices=list(WORKFLOWS), help="workflow to run")
+    parser.add_argument("input", nargs="?", help="JSON input state (read from stdin when omitted)")
+    parser.add_argument("--list", action="store_true", help="list available workflows")
+    parser.add_argument("--thread-id", help="resume/continue this thread, persisted in CHECKPOINT_PATH (workflows with a checkpointer only)")
+    parser.add_argument("--mermaid", action="store_true", help="print the workflow graph instead of running it")
+    parser.add_argument("--check-startup", action="store_true", help="measure module import time against the cold-start target")
+    parser.add_argument("--batch", metavar="INPUTS", help="run the workflow on every line of this JSONL file")
+    parser.add_argument("--output", metavar="RESULTS", help="JSONL results of --batch; an existing file is resumed")
+    parser.add_argument("--processes", type=int, help="worker processes for --batch (default: up to 4)")
+    parser.add_argument("--concurrency", type=int, help="graphs in flight per worker process for --batch")
+    args = parser.parse_intermixed_args(argv)
+
+    if args.list:
+        print("\n".join(WORKFLOWS))
+        return 0
+    if args.check_startup:
+        return 0 if check_startup() else 1
+    if args.workflow is None:
+        parser.error("a workflow name is required")
+
+    if args.batch:
+        if not args.output:
+            parser.error("--batch requires --output")
+        counts = run_batch(args.workflow, args.batch, args.output, args.processes, args.concurrency)
+        print(json.dumps(counts))
+        return 1 if counts["failed"] else 0
+
+    config = None
+    if args.thread_id:
+        if "checkpointer" not in inspect.signature(load_workflow(args.workflow).build_graph).parameters:
+            parser.error(f"workflow {args.workflow!r} does not support --thread-id")
+        import settings
+        from utils.checkpointer import SQLiteCheckpointSaver
+
+        graph = build_graph(args.workflow, checkpointer=SQLiteCheckpointSaver(settings.CHECKPOINT_PATH))
+        config = {"configurable": {"thread_id": args.thread_id}}
+    else:
+        graph = build_graph(args.workflow)
+    if args.mermaid:
+        print(graph.get_graph().draw_mermaid())
+        return 0
+
+    state = graph.invoke(json.loads(args.input if args.input is not None else sys.stdin.read()), config)
+    print(json.dumps(state, default=_to_json, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,81 @@
+import os
+
 # AWS Configuration
 AWS_REGION = "us-east-1"  # Update with your region
 CLAUDE_3_7_SONNET_MODEL_ID = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
+CLAUDE_3_5_HAIKU_MODEL_ID = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
+THINKING_BUDGET_TOKENS = 4096  # Extended thinking budget for clients created with thinking=True
+
+# Client Configuration (the environment variables override these per deployment)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "50"))  # Max Bedrock calls in flight per process
+LLM_POOL_HEADROOM = 4  # Connections beyond LLM_MAX_CONCURRENCY, for responses still draining after their slot was freed
+LLM_MAX_POOL_CONNECTIONS = int(os.getenv("LLM_MAX_POOL_CONNECTIONS", "0")) or None  # default: concurrency + headroom
+
+# Output budgets: max_tokens for the model calls of a graph node. Each workflow declares its budgets
+# next to its nodes (output_budget in utils/llm_client.py); entries here override them, e.g. with the
+# values suggested by `python -m utils.tracing .cache/spans.jsonl --budgets`
+NODE_OUTPUT_BUDGETS = {}
+MODEL_CONTEXT_TOKENS = 200_000  # Claude 3.7 Sonnet and 3.5 Haiku; prompts are checked against it before sending
+
+# Single flight: concurrent identical calls (same model, messages, kwargs and schema) share one
+# Bedrock request and all get its response
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+
+# Hedged requests (opt-in, per graph node): when a call from one of these nodes is still running after
+# the node's recent LLM_HEDGE_QUANTILE latency, an identical request is sent and the first answer used
+LLM_HEDGE_NODES = frozenset(filter(None, os.getenv("LLM_HEDGE_NODES", "").split(",")))  # e.g. "router,evaluator"
+LLM_HEDGE_QUANTILE = 0.95
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))  # at most this share of calls is hedged
+LLM_HEDGE_MIN_SAMPLES = 20  # calls observed from a node before its calls are hedged
+
+# Model cascade (opt-in, per graph node): calls from these nodes go to LLM_CASCADE_MODEL_ID first and
+# only escalate to Claude 3.7 Sonnet when the answer fails the node's check (see utils/cascade.py)
+LLM_CASCADE_NODES = frozenset(filter(None, os.getenv("LLM_CASCADE_NODES", "").split(",")))  # e.g. "router,evaluator,clarify_with_user"
+LLM_CASCADE_MODEL_ID = os.getenv("LLM_CASCADE_MODEL_ID", CLAUDE_3_5_HAIKU_MODEL_ID)
+LLM_CASCADE_MAX_ESCALATION_RATE = 0.5  # above this share of recent escalations, a node skips the small model
+LLM_CASCADE_MIN_SAMPLES = 20  # small-model calls observed from a node before it can be skipped
+
+# Deadlines (seconds) for one model call, by graph node. A call's socket read timeout is its
+# deadline and a stream is cut off once it passes it, so a stuck call frees its connection.
+LLM_DEFAULT_DEADLINE_SECONDS = 180  # 8192 output tokens at ~60 tokens/s, with margin
+NODE_DEADLINES = {
+    "router": 30,
+    "evaluator": 60,
+    "clarify_with_user": 60,
+    "orchestrator": 90,
+    "write_research_brief": 120,
+    "llm_worker": 120,  # 4096 output tokens (its output budget), with margin
+}
+
+# Response Cache (opt-in): set LLM_CACHE_PATH to persist responses across runs
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # e.g. ".cache/llm_responses.sqlite"
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600
+LLM_CACHE_MAX_ENTRIES = 100_000
+
+# Semantic cache (opt-in, per graph node): answer prompts worded almost like an earlier one
+# ("Software Engineers" vs "software engineer") from memory. Only list nodes whose answers are
+# safe to share between such inputs, e.g. SEMANTIC_CACHE_NODES=router,joke_writer
+SEMANTIC_CACHE_NODES = frozenset(filter(None, os.getenv("SEMANTIC_CACHE_NODES", "").split(",")))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))  # Jaccard similarity of normalized words and word pairs
+SEMANTIC_CACHE_MAX_ENTRIES = 10_000  # least recently used responses kept
+SEMANTIC_CACHE_AUDIT_RATE = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0"))  # share of hits re-asked to count false hits
+SEMANTIC_CACHE_AUDIT_PATH = os.getenv("SEMANTIC_CACHE_AUDIT_PATH")  # e.g. ".cache/semantic_audit.jsonl"
+
+# Checkpoints: durable LangGraph thread state (multi-turn workflows such as deep research scoping)
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", ".cache/checkpoints.sqlite")
+
+# Tracing (off unless one is set): per-node and per-call spans as JSONL, and/or a Prometheus endpoint
+TRACE_PATH = os.getenv("TRACE_PATH")  # e.g. ".cache/spans.jsonl"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None  # serves /metrics on this port
+
+# Rate Limiting: per-model quotas shared by all threads and local processes (None = unlimited).
+# The in-flight limit (at most LLM_MAX_CONCURRENCY) backs off automatically when Bedrock throttles.
+LLM_RATE_LIMITS = {
+    CLAUDE_3_7_SONNET_MODEL_ID: {"requests_per_minute": None, "tokens_per_minute": None},
+    CLAUDE_3_5_HAIKU_MODEL_ID: {"requests_per_minute": None, "tokens_per_minute": None},
+}
+# In the project directory whatever the working directory, so other users and projects on the host
+# keep their own backoff
+LLM_RATE_LIMIT_STATE_PATH = os.getenv(
+    "LLM_RATE_LIMIT_STATE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "rate_limits.json")
+)
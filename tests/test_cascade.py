@@ -0,0 +1,88 @@
+import pytest
+from pydantic import BaseModel
+
+import settings
+from benchmarks.fake_bedrock import FakeBedrockRuntime
+from utils.cascade import Cascade, CascadeStats, cascade_stats, model_cascade
+from utils.llm_client import get_client_registry
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class RecordingFake(FakeBedrockRuntime):
+    """Fake backend that remembers which model every call went to."""
+
+    def __init__(self):
+        super().__init__()
+        self.models = []
+
+    def invoke_model(self, **kwargs):
+        self.models.append(kwargs["modelId"])
+        return super().invoke_model(**kwargs)
+
+
+@pytest.fixture
+def fake(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "LLM_RATE_LIMIT_STATE_PATH", str(tmp_path / "rate_limits.json"))
+    runtime = RecordingFake()
+    get_client_registry().set_runtime_client_factory(lambda region: runtime)
+    yield runtime
+    get_client_registry().set_runtime_client_factory(None)
+
+
+def _cascade(accept, stats):
+    registry = get_client_registry()
+    small = registry.get(settings.CLAUDE_3_5_HAIKU_MODEL_ID, max_tokens=256).with_structured_output(Answer)
+    large = registry.get(settings.CLAUDE_3_7_SONNET_MODEL_ID, max_tokens=256).with_structured_output(Answer)
+    return Cascade("node", small, large, accept, min_samples=1, probe_every=2, stats=stats)
+
+
+def test_accepted_answer_stays_with_the_small_model(fake):
+    stats = CascadeStats()
+
+    answer = _cascade(lambda answer: True, stats).invoke("Say something")
+
+    assert isinstance(answer, Answer)
+    assert fake.models == [settings.CLAUDE_3_5_HAIKU_MODEL_ID]
+    counters = stats.stats()["node"]
+    assert (counters["calls"], counters["escalated"], counters["rejected"]) == (1, 0, 0)
+    assert counters["escalation_rate"] == 0.0
+
+
+def test_rejected_answer_escalates_to_the_large_model(fake):
+    stats = CascadeStats()
+    cascade = _cascade(lambda answer: False, stats)
+
+    cascade.invoke("Say something")
+
+    assert fake.models == [settings.CLAUDE_3_5_HAIKU_MODEL_ID, settings.CLAUDE_3_7_SONNET_MODEL_ID]
+    counters = stats.stats()["node"]
+    assert (counters["calls"], counters["escalated"], counters["rejected"]) == (1, 1, 1)
+    assert counters["saved_seconds"] is not None
+
+    # Once it mostly escalates, the node skips the small model except for one call in probe_every
+    fake.models.clear()
+    for _ in range(3):
+        cascade.invoke("Say something else")
+    assert fake.models.count(settings.CLAUDE_3_7_SONNET_MODEL_ID) == 3
+    assert fake.models.count(settings.CLAUDE_3_5_HAIKU_MODEL_ID) == 1
+    counters = stats.stats()["node"]
+    assert (counters["calls"], counters["skipped"], counters["escalated"]) == (4, 2, 2)
+    assert counters["escalation_rate"] == 1.0
+
+
+def test_both_outcomes_are_counted_per_node(fake, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CASCADE_NODES", frozenset({"cascade_test"}))
+    verdicts = iter([True, False])
+    cascade = model_cascade("cascade_test", lambda llm: llm.with_structured_output(Answer),
+                            accept=lambda answer: next(verdicts), max_tokens=256)
+
+    cascade.invoke("First")
+    cascade.invoke("Second")
+
+    counters = cascade_stats()["cascade_test"]
+    assert (counters["calls"], counters["escalated"], counters["rejected"]) == (2, 1, 1)
+    assert counters["escalation_rate"] == 0.5
+    assert fake.models.count(settings.CLAUDE_3_7_SONNET_MODEL_ID) == 1
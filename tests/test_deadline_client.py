@@ -0,0 +1,54 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pytest
+
+from utils.llm_client import DeadlineClient, _per_request_read_timeout, call_deadline, get_bedrock_config
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(1)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+        except OSError:
+            # The client gave up at its deadline
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_each_call_gets_its_own_deadline(endpoint, shared):
+    if shared and not _per_request_read_timeout():
+        pytest.skip("botocore has no per-request read timeout")
+    session = boto3.Session(aws_access_key_id="key", aws_secret_access_key="secret", region_name="us-east-1")
+    client = DeadlineClient(
+        lambda read_timeout: session.client("bedrock-runtime", endpoint_url=endpoint, config=get_bedrock_config(read_timeout)),
+        shared=shared,
+    )
+
+    started = time.monotonic()
+    with call_deadline(0.2), pytest.raises(Exception, match="Read timeout"):
+        client.invoke_model(modelId="model", body=b"{}")
+    assert time.monotonic() - started < 0.9
+    with call_deadline(5):
+        client.invoke_model(modelId="model", body=b"{}")
+
+    # One client and connection pool for every deadline where botocore allows it
+    assert len(client.clients) == (1 if shared else 2)
@@ -0,0 +1,32 @@
+import pytest
+
+from run_workflow import load_workflow
+
+evaluator_optimizer = load_workflow("evaluator_optimizer")
+Evaluate = evaluator_optimizer.Evaluate
+
+
+def test_best_of_n_skips_failed_candidates(monkeypatch):
+    def write_candidate(topic, candidate, candidates, previous=None):
+        if candidate == 0:
+            raise RuntimeError("throttled")
+        if candidate == 1:
+            return "no grade", None
+        return f"joke {candidate}", Evaluate(grade="not_funny", feedback="more punch")
+
+    monkeypatch.setattr(evaluator_optimizer, "write_candidate", write_candidate)
+
+    state = evaluator_optimizer.make_best_of_n(candidates=3, max_rounds=2)({"topic": "cats"})
+
+    assert state["joke"] == "joke 2"
+    assert state["evaluation"].grade == "not_funny"
+
+
+def test_best_of_n_fails_when_every_candidate_fails(monkeypatch):
+    def write_candidate(topic, candidate, candidates, previous=None):
+        raise RuntimeError("throttled")
+
+    monkeypatch.setattr(evaluator_optimizer, "write_candidate", write_candidate)
+
+    with pytest.raises(RuntimeError):
+        evaluator_optimizer.make_best_of_n(candidates=2, max_rounds=1)({"topic": "cats"})
@@ -0,0 +1,45 @@
+import time
+
+from utils.llm_client import Hedger
+
+
+def _request(queued, service, answer):
+    def request(on_sent):
+        time.sleep(queued)
+        on_sent()
+        time.sleep(service)
+        return answer
+
+    return request
+
+
+def _warmed_up(service=0.01):
+    hedger = Hedger(["node"], budget=1.0, min_samples=5)
+    for _ in range(5):
+        hedger.call("node", _request(0.0, service, "warm-up"))
+    return hedger
+
+
+def test_latency_is_measured_from_sending():
+    hedger = Hedger(["node"], min_samples=1)
+
+    hedger.call("node", _request(0.2, 0.01, "ok"))
+
+    assert hedger.delay("node") < 0.1
+
+
+def test_queued_call_is_not_hedged():
+    hedger = _warmed_up()
+
+    result, hedge_won = hedger.call("node", _request(0.2, 0.0, "primary"), _request(0.0, 0.0, "hedge"))
+
+    assert (result, hedge_won) == ("primary", None)
+    assert hedger.stats()["node"]["hedged"] == 0
+
+
+def test_slow_call_is_hedged_with_the_duplicate():
+    hedger = _warmed_up()
+
+    result, hedge_won = hedger.call("node", _request(0.0, 0.5, "primary"), _request(0.0, 0.0, "hedge"))
+
+    assert (result, hedge_won) == ("hedge", True)
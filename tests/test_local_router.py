@@ -0,0 +1,19 @@
+from utils.local_router import NaiveBayesRouter
+
+
+def test_unseen_input_gets_no_prediction():
+    router = NaiveBayesRouter().fit([("write a poem about the sea", "poem")] * 95 + [("tell me a joke", "joke")] * 5)
+
+    assert router.predict("zzzz qqqq") == (None, 0.0)
+    assert router.predict("a poem about the moon")[0] == "poem"
+
+
+def test_save_and_load_keep_predictions(tmp_path):
+    router = NaiveBayesRouter(min_known_features=2).fit([("write a poem", "poem"), ("tell me a joke", "joke")])
+    path = str(tmp_path / "router.json")
+    router.save(path)
+
+    loaded = NaiveBayesRouter.load(path)
+
+    assert loaded.predict("a joke please") == router.predict("a joke please")
+    assert loaded.predict("poem") == (None, 0.0)
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import settings
+from benchmarks.fake_bedrock import FakeBedrockRuntime
+from run_workflow import load_workflow
+from utils.llm_client import Claude3_7SonnetFactory, call_deadline, get_client_registry, get_rate_limiter
+
+parallel = load_workflow("parallel")
+
+
+@pytest.fixture
+def fake(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "LLM_RATE_LIMIT_STATE_PATH", str(tmp_path / "rate_limits.json"))
+    runtime = FakeBedrockRuntime()
+    get_client_registry().set_runtime_client_factory(lambda region: runtime)
+    yield runtime
+    get_client_registry().set_runtime_client_factory(None)
+
+
+def test_fake_backend_keeps_its_own_rate_limit_state(fake, tmp_path):
+    # Limiters built before the fixture would share backoff state with the real one
+    assert get_rate_limiter(settings.CLAUDE_3_7_SONNET_MODEL_ID).store.path == str(tmp_path / "rate_limits.json")
+
+
+def test_failed_and_missing_branches_are_marked_apart():
+    state = {
+        "topic": "cats",
+        "poem": "a poem",
+        "branch_timings": {"poem": {"status": "ok"}, "story": {"status": "error"}, "joke": {"status": "missing"}},
+    }
+
+    combined = parallel.aggregate_results(state)["combined_result"]
+
+    assert f"Story: {parallel.FAILED}" in combined
+    assert f"Joke: {parallel.MISSING}" in combined
+
+
+def test_fan_in_reports_a_failing_writer(fake, monkeypatch):
+    def broken(state):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(parallel.BRANCHES, "story", broken)
+
+    state = parallel.build_graph(deadline=30).invoke({"topic": "cats"})
+
+    assert state["branch_timings"]["story"]["status"] == "error"
+    assert f"Story: {parallel.FAILED}" in state["combined_result"]
+    assert parallel.MISSING not in state["combined_result"]
+
+
+def test_call_past_its_deadline_is_not_sent(fake):
+    llm = Claude3_7SonnetFactory().create_client()
+
+    with call_deadline(5, expires=time.monotonic() - 1), pytest.raises(TimeoutError):
+        llm.invoke("Write a joke about cats")
+
+    assert fake.stats().get("invoked", 0) == 0
@@ -0,0 +1,47 @@
+import pytest
+
+from utils.rate_limiter import AdaptiveRateLimiter, SharedStateStore
+
+
+class ClientError(Exception):
+    def __init__(self, code, status):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}
+
+
+class ReadTimeoutError(Exception):
+    pass
+
+
+def _limiter(tmp_path):
+    return AdaptiveRateLimiter("model", SharedStateStore(str(tmp_path / "state.json")), base_backoff=0.001, max_concurrency=4)
+
+
+def _failing(errors):
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return call
+
+
+def test_server_errors_are_retried_without_backing_off(tmp_path):
+    limiter = _limiter(tmp_path)
+    stats = {}
+
+    assert limiter.call(_failing([ClientError("InternalServerException", 500)]), stats=stats) == "ok"
+    assert stats["retries"] == 1
+    assert limiter.stats()["concurrency_limit"] == 4
+    assert limiter.stats()["backoff_remaining"] == 0
+
+
+def test_read_timeouts_and_client_errors_are_not_retried(tmp_path):
+    limiter = _limiter(tmp_path)
+
+    with pytest.raises(ReadTimeoutError):
+        limiter.call(_failing([ReadTimeoutError()]))
+    with pytest.raises(ClientError):
+        limiter.call(_failing([ClientError("ValidationException", 400)]))
@@ -0,0 +1,24 @@
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from utils.response_cache import SQLiteResponseCache
+
+
+def test_evicts_every_n_writes(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"), max_entries=2, evict_every=3)
+
+    for i in range(4):
+        cache.update(f"prompt {i}", "llm", [ChatGeneration(message=AIMessage(content=str(i)))])
+
+    # Evicted on the first and fourth writes
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evicted"] == 2
+    assert cache.lookup("prompt 3", "llm")[0].message.content == "3"
+
+
+def test_ttl_eviction_uses_the_created_at_index(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60)
+
+    plan = cache._connection().execute("EXPLAIN QUERY PLAN DELETE FROM responses WHERE created_at < 0").fetchall()
+
+    assert any("responses_created_at" in row[-1] for row in plan)
@@ -0,0 +1,56 @@
+from langchain_core.runnables import RunnableLambda
+
+from run_workflow import load_workflow
+
+routing = load_workflow("routing")
+
+
+def test_batch_route_isolates_an_answer_without_tool_call(monkeypatch):
+    # The chunk answer has the wrong number of routes, so every input is re-routed alone;
+    # the model then answers the second one without the Route tool call
+    monkeypatch.setattr(routing, "get_batch_router_llm", lambda: RunnableLambda(lambda messages: routing.Routes(routes=[])))
+    answers = {"a poem please": routing.Route(step="poem"), "hmm": None, "tell me a joke": routing.Route(step="joke")}
+    monkeypatch.setattr(routing, "get_router_llm", lambda: RunnableLambda(lambda messages: answers[messages[-1].content]))
+
+    decisions = routing.batch_route(list(answers))
+
+    assert decisions[0] == "poem"
+    assert isinstance(decisions[1], ValueError)
+    assert decisions[2] == "joke"
+
+
+def test_run_batch_tags_calls_with_their_node(monkeypatch):
+    # Outside the graph, every call still carries its node for budgets, deadlines and tracing
+    nodes = []
+
+    def node(config):
+        nodes.append(config["metadata"].get("langgraph_node"))
+
+    def batch_router(messages, config):
+        node(config)
+        return routing.Routes(routes=[routing.Route(step="poem")])
+
+    def router(messages, config):
+        node(config)
+        return routing.Route(step="joke")
+
+    def writer(state, config):
+        node(config)
+        return {"output": state["decision"]}
+
+    monkeypatch.setattr(routing, "get_batch_router_llm", lambda: RunnableLambda(batch_router))
+    monkeypatch.setattr(routing, "get_router_llm", lambda: RunnableLambda(router))
+    monkeypatch.setattr(routing, "poem_writer", writer)
+    monkeypatch.setattr(routing, "joke_writer", writer)
+
+    states = routing.run_batch(["a poem please", "tell me a joke"], chunk_size=1)
+
+    assert [state["output"] for state in states] == ["poem", "poem"]
+    assert sorted(nodes) == ["batch_router", "batch_router", "poem_writer", "poem_writer"]
+
+    # A chunk of two gets one route, so both inputs are re-routed alone
+    nodes.clear()
+    states = routing.run_batch(["a poem please", "tell me a joke"])
+
+    assert [state["output"] for state in states] == ["joke", "joke"]
+    assert sorted(nodes) == ["batch_router", "joke_writer", "joke_writer", "router", "router"]
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from utils.llm_client import SingleFlight
+
+
+def test_waiter_gives_up_at_its_own_deadline():
+    flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait()
+        return "late"
+
+    leader = threading.Thread(target=flight.call, args=("key", slow))
+    leader.start()
+    started.wait()
+    began = time.monotonic()
+    with pytest.raises(TimeoutError):
+        flight.call("key", lambda: "own", timeout=0.1)
+    assert time.monotonic() - began < 1
+    release.set()
+    leader.join()
+
+
+def test_waiter_retries_when_the_shared_call_times_out():
+    flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+
+    def short_deadline():
+        started.set()
+        release.wait()
+        raise TimeoutError("leader deadline")
+
+    errors = []
+    leader = threading.Thread(target=lambda: errors.append(pytest.raises(TimeoutError, flight.call, "key", short_deadline)))
+    leader.start()
+    started.wait()
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(value=flight.call("key", lambda: "own", timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    waiter.join()
+
+    assert errors
+    assert result["value"] == ("own", False)
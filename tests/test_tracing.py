@@ -0,0 +1,17 @@
+from utils.tracing import Tracer
+
+
+def _llm_span(**extra):
+    return {"kind": "llm", "node": "router", "model": "m", "status": "ok", "duration": 0.1, "input_tokens": 129, "output_tokens": 10, **extra}
+
+
+def test_token_totals_skip_cache_hits_and_coalesced_calls():
+    tracer = Tracer()
+    tracer.record(_llm_span(cache_hit=False))
+    tracer.record(_llm_span(cache_hit=True))
+    tracer.record(_llm_span(cache_hit=False, coalesced=True))
+
+    lines = tracer.metrics.render().splitlines()
+
+    assert 'llm_tokens_total{model="m",node="router",type="input"} 129.0' in lines
+    assert 'llm_tokens_total{model="m",node="router",type="output"} 10.0' in lines
@@ -0,0 +1,333 @@
+import asyncio
+import hashlib
+import time
+from contextvars import copy_context
+from functools import partial
+from itertools import chain
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_aws import ChatBedrock
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables.config import var_child_runnable_config
+from pydantic import Field, PrivateAttr
+
+import settings
+
+from utils.llm_client import (
+    Hedger,
+    SingleFlight,
+    call_deadline,
+    current_deadline,
+    deadline_expires,
+    get_executor,
+    node_deadline,
+    node_output_budget,
+)
+from utils.prompt_cache import prompt_cache_stats, take_cache_usage
+from utils.rate_limiter import AdaptiveRateLimiter, is_throttling_error, is_transient_error
+from utils.tokens import estimate_message_tokens
+
+
+def _node(run_manager) -> Optional[str]:
+    metadata = getattr(run_manager, "metadata", None)
+    if metadata is None:
+        # invoke() on a streaming model calls _stream without a run manager
+        metadata = (var_child_runnable_config.get() or {}).get("metadata")
+    return (metadata or {}).get("langgraph_node")
+
+
+def _total_tokens(result: ChatResult) -> Optional[int]:
+    usage = result.generations[0].message.usage_metadata if result.generations else None
+    return usage["total_tokens"] if usage else None
+
+
+async def _run_in_executor(func, *args, **kwargs):
+    ctx = copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), partial(ctx.run, func, *args, **kwargs)
+    )
+
+
+def _check_expired(expires: Optional[float], seconds: float) -> None:
+    if expires is not None and time.monotonic() >= expires:
+        raise TimeoutError(f"Model call passed its {seconds:g}s deadline before it was sent")
+
+
+def _mark_coalesced(result: ChatResult) -> ChatResult:
+    for generation in result.generations:
+        # This caller neither waited for the limiter nor spent tokens
+        generation.message.response_metadata["call_stats"] = {"queue_wait": 0.0, "retries": 0, "coalesced": True}
+    return result
+
+
+class BedrockChatModel(ChatBedrock):
+    """ChatBedrock with an async API that runs on the shared bounded pool.
+
+    When ``limiter`` is set, every call (including streams) goes through it.
+    Each call gets the deadline of an enclosing ``call_deadline``, or else of
+    the graph node making it (``NODE_DEADLINES``), as its read timeout, and a
+    stream still running at the deadline is cut off with ``TimeoutError``.
+    Prompt-cache usage reported by Bedrock is added to ``usage_metadata``
+    as ``input_token_details`` and counted in ``prompt_cache_stats``.
+
+    A call from a graph node with an output budget (``output_budget``) is
+    sent with that ``max_tokens`` when it is lower than the client's. Before
+    sending, the prompt size is estimated locally: a prompt that cannot fit
+    the context window fails right away, and ``max_tokens`` is lowered to
+    what is left of the window.
+
+    With ``single_flight`` set, a non-streamed call identical to one already
+    in flight (same model, messages, kwargs and output schema) waits for
+    that call's response instead of sending its own request. With
+    ``hedger`` set, a slow non-streamed call from a node it covers gets a
+    duplicate request, and the first answer is used.
+    """
+
+    limiter: Optional[AdaptiveRateLimiter] = Field(default=None, exclude=True)
+    single_flight: Optional[SingleFlight] = Field(default=None, exclude=True)
+    hedger: Optional[Hedger] = Field(default=None, exclude=True)
+    # Copies of this client with a lower max_tokens, by max_tokens
+    _sized: Dict[int, "BedrockChatModel"] = PrivateAttr(default_factory=dict)
+
+    def _reserved_tokens(self, messages: List[BaseMessage], **kwargs: Any) -> int:
+        # Bedrock counts max_tokens against the TPM quota up front, so do we
+        max_tokens = kwargs.get("max_tokens") or self.max_tokens or 0
+        return estimate_message_tokens(messages) + max_tokens
+
+    def _for_call(self, messages: List[BaseMessage], node: Optional[str]) -> "BedrockChatModel":
+        """This client, or a copy with the ``max_tokens`` that node ``node`` and the prompt leave."""
+        max_tokens = self.max_tokens
+        reserved = 0
+        thinking = (self.model_kwargs or {}).get("thinking")
+        if thinking:
+            # The thinking budget counts against max_tokens on top of the answer
+            reserved = thinking["budget_tokens"]
+        budget = node_output_budget(node)
+        if budget is not None:
+            max_tokens = min(max_tokens or budget + reserved, budget + reserved)
+        prompt_tokens = estimate_message_tokens(messages)
+        room = settings.MODEL_CONTEXT_TOKENS - prompt_tokens
+        if room <= reserved:
+            raise ValueError(
+                f"Prompt from node {node!r} is about {prompt_tokens} tokens and does not fit the "
+                f"{settings.MODEL_CONTEXT_TOKENS}-token context window"
+            )
+        if max_tokens is not None:
+            max_tokens = min(max_tokens, room)
+        if max_tokens == self.max_tokens:
+            return self
+        sized = self._sized.get(max_tokens)
+        if sized is None:
+            sized = self._sized[max_tokens] = self.model_copy(update={"max_tokens": max_tokens})
+        return sized
+
+    def _flight_key(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> str:
+        # The same key the response cache matches on
+        llm_string = self._get_llm_string(stop=stop, **kwargs)
+        return hashlib.sha256(f"{llm_string}\x00{dumps(messages)}".encode()).hexdigest()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.single_flight is None:
+            return self._generate_once(messages, stop, run_manager, **kwargs)
+        result, coalesced = self.single_flight.call(
+            self._flight_key(messages, stop, **kwargs),
+            partial(self._generate_once, messages, stop, run_manager, **kwargs),
+            # Waiting for an identical call is bounded by this caller's own deadline
+            current_deadline() or node_deadline(_node(run_manager)),
+        )
+        return _mark_coalesced(result) if coalesced else result
+
+    def _generate_once(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        node = _node(run_manager)
+        model = self._for_call(messages, node)
+        if model is not self:
+            return model._generate_once(messages, stop, run_manager, **kwargs)
+        # A deadline set by the caller (e.g. per fan-out worker) wins over the node's
+        seconds, expires = current_deadline() or node_deadline(node), deadline_expires()
+        request = partial(self._request, messages, stop, run_manager, seconds, expires, **kwargs)
+        if self.hedger is None:
+            result, usage, call_stats = request()
+        else:
+            # The duplicate reports to no run: its events would be mixed into the caller's
+            duplicate = partial(self._request, messages, stop, None, seconds, expires, **kwargs)
+            (result, usage, call_stats), hedge_won = self.hedger.call(node, request, duplicate)
+            if hedge_won is not None:
+                call_stats["hedge_won"] = hedge_won
+
+        message = result.generations[0].message if result.generations else None
+        if usage is None and message is not None:
+            # Newer langchain_aws releases pass the counts through themselves
+            reported = message.response_metadata.get("usage", {})
+            if "cache_read_input_tokens" in reported:
+                usage = {
+                    "cache_read": reported["cache_read_input_tokens"],
+                    "cache_creation": reported.get("cache_write_input_tokens", 0),
+                }
+        if usage is not None and message is not None and message.usage_metadata:
+            # Same place ChatAnthropic reports it, so callers can read either
+            message.usage_metadata["input_token_details"] = usage
+            prompt_cache_stats.record(message.usage_metadata["input_tokens"], usage, node)
+        if message is not None:
+            message.response_metadata["call_stats"] = call_stats
+        return result
+
+    def _request(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]],
+        run_manager,
+        seconds: float,
+        expires: Optional[float],
+        on_sent: Optional[Callable[[], None]] = None,
+        **kwargs: Any,
+    ) -> Tuple[ChatResult, Optional[Dict[str, int]], Dict[str, Any]]:
+        """One request through the limiter with a ``seconds`` deadline, on any thread.
+
+        The request is not sent once the caller's deadline (``expires``,
+        see :func:`call_deadline`) has passed while it waited for the limiter;
+        otherwise ``on_sent()`` is called right before sending it.
+        Returns the result, its prompt-cache usage and the limiter's call stats.
+        """
+        send = partial(super()._generate, messages, stop, run_manager, **kwargs)
+
+        def generate() -> ChatResult:
+            _check_expired(expires, seconds)
+            if on_sent is not None:
+                on_sent()
+            return send()
+
+        call_stats = {"queue_wait": 0.0, "retries": 0}
+        with call_deadline(seconds):
+            if self.limiter is None:
+                result = generate()
+            else:
+                result = self.limiter.call(
+                    generate, self._reserved_tokens(messages, **kwargs), _total_tokens, call_stats
+                )
+        # Recorded by the thread that made the call
+        return result, take_cache_usage(), call_stats
+
+    def _stream_with_cache_usage(self, messages, stop, run_manager, **kwargs) -> Iterator[ChatGenerationChunk]:
+        node = _node(run_manager)
+        seconds = current_deadline() or node_deadline(node)
+        expires = time.monotonic() + seconds
+        chunks = super()._stream(messages, stop, run_manager, **kwargs)
+        # The request is sent on the first next(), which picks the read timeout
+        with call_deadline(seconds):
+            first = next(chunks, None)
+        if first is None:
+            return
+        # The call has just been made, in this thread: async streams pull
+        # later chunks from other pool threads
+        usage, input_tokens = take_cache_usage(), 0
+        for chunk in chain([first], chunks):
+            if time.monotonic() > expires:
+                chunks.close()
+                raise TimeoutError(f"Model call from node {node!r} passed its {seconds:g}s deadline")
+            if chunk.message.usage_metadata:
+                input_tokens += chunk.message.usage_metadata["input_tokens"]
+            yield chunk
+        if usage is not None:
+            prompt_cache_stats.record(input_tokens, usage, _node(run_manager))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        model = self._for_call(messages, _node(run_manager))
+        if model is not self:
+            yield from model._stream(messages, stop, run_manager, **kwargs)
+            return
+        if self.limiter is None:
+            yield from self._stream_with_cache_usage(messages, stop, run_manager, **kwargs)
+            return
+        tokens = self._reserved_tokens(messages, **kwargs)
+        expires = deadline_expires()
+        queue_wait = 0.0
+        for attempt in range(self.limiter.max_retries + 1):
+            queue_wait += self.limiter.acquire(tokens)
+            started, released, used = False, False, None
+            try:
+                _check_expired(expires, current_deadline() or 0)
+                for chunk in self._stream_with_cache_usage(messages, stop, run_manager, **kwargs):
+                    if not started:
+                        chunk.message.response_metadata["call_stats"] = {"queue_wait": queue_wait, "retries": attempt}
+                    started = True
+                    if chunk.message.usage_metadata:
+                        used = (used or 0) + chunk.message.usage_metadata["total_tokens"]
+                    yield chunk
+            except Exception as error:
+                throttled = is_throttling_error(error)
+                transient = not throttled and is_transient_error(error)
+                self.limiter.release(tokens, throttled=throttled, failed=transient)
+                released = True
+                # Only a stream that has not produced anything yet can be replayed
+                if (throttled or transient) and not started and attempt < self.limiter.max_retries:
+                    if transient:
+                        self.limiter.pause(attempt)
+                    continue
+                raise
+            finally:
+                if not released:
+                    self.limiter.release(tokens, used)
+            return
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        generate = partial(
+            _run_in_executor,
+            self._generate_once,
+            messages,
+            stop,
+            run_manager.get_sync() if run_manager else None,
+            **kwargs,
+        )
+        if self.single_flight is None:
+            return await generate()
+        result, coalesced = await self.single_flight.acall(
+            self._flight_key(messages, stop, **kwargs), generate, current_deadline() or node_deadline(_node(run_manager))
+        )
+        return _mark_coalesced(result) if coalesced else result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        iterator = await _run_in_executor(
+            self._stream,
+            messages,
+            stop,
+            run_manager.get_sync() if run_manager else None,
+            **kwargs,
+        )
+        done = object()
+        while True:
+            chunk = await _run_in_executor(next, iterator, done)
+            if chunk is done:
+                break
+            yield chunk
@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Optional
+
+import settings
+
+from utils.llm_client import get_client_registry
+
+Accept = Callable[[Any], bool]
+
+
+def _accept_any(result: Any) -> bool:
+    # Structured output gives None when the model answered without the tool call
+    return result is not None
+
+
+class CascadeStats:
+    """Per-node counters of the model cascades in this process."""
+
+    def __init__(self, window: int = 200):
+        self._window = window
+        self._reset()
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(lambda: {
+            "calls": 0, "escalated": 0, "rejected": 0, "errors": 0, "skipped": 0,
+            "small_seconds": 0.0, "large_seconds": 0.0, "large_calls": 0,
+        })
+        # Recent outcomes by node (True: escalated), for the escalation rate that decides skipping
+        self._recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self._window))
+
+    def record(self, node: str, outcome: str, small_seconds: Optional[float], large_seconds: Optional[float]) -> None:
+        """``outcome`` is "accepted", "rejected", "error" or "skipped" (the small model was not tried)."""
+        with self._lock:
+            counters = self._counters[node]
+            counters["calls"] += 1
+            if outcome == "rejected":
+                counters["rejected"] += 1
+            elif outcome == "error":
+                counters["errors"] += 1
+            elif outcome == "skipped":
+                counters["skipped"] += 1
+            if outcome in ("rejected", "error"):
+                counters["escalated"] += 1
+            if small_seconds is not None:
+                counters["small_seconds"] += small_seconds
+                self._recent[node].append(outcome != "accepted")
+            if large_seconds is not None:
+                counters["large_seconds"] += large_seconds
+                counters["large_calls"] += 1
+
+    def escalation_rate(self, node: str) -> Optional[float]:
+        """Share of the node's recent small-model calls that escalated, or ``None`` without samples."""
+        with self._lock:
+            recent = list(self._recent[node])
+        return sum(recent) / len(recent) if recent else None
+
+    def samples(self, node: str) -> int:
+        with self._lock:
+            return len(self._recent[node])
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per node: calls, escalations (``rejected`` answers and ``errors``), calls that ``skipped`` the
+        small model, the escalation rate, and the seconds saved against sending every call to the large
+        model (estimated from the mean large-model latency; ``None`` until it has been called once)."""
+        with self._lock:
+            counters = {node: dict(values) for node, values in self._counters.items()}
+        for node, stats in counters.items():
+            tried = stats["calls"] - stats["skipped"]
+            stats["escalation_rate"] = stats["escalated"] / tried if tried else 0.0
+            large_calls = stats.pop("large_calls")
+            if large_calls:
+                mean_large = stats["large_seconds"] / large_calls
+                spent = stats["small_seconds"] + stats["large_seconds"]
+                stats["saved_seconds"] = stats["calls"] * mean_large - spent
+                stats["saved_ratio"] = stats["saved_seconds"] / (stats["calls"] * mean_large) if mean_large else 0.0
+            else:
+                stats["saved_seconds"] = stats["saved_ratio"] = None
+        return counters
+
+
+_stats = CascadeStats()
+
+if hasattr(os, "register_at_fork"):
+    # A child's counters start empty, like the other per-process client state
+    os.register_at_fork(after_in_child=_stats._reset)
+
+
+def cascade_stats() -> Dict[str, Dict[str, Any]]:
+    return _stats.stats()
+
+
+class Cascade:
+    """Answers with a small model and escalates to the large one when it has to.
+
+    ``small`` is called first. Its answer is used if ``accept(answer)`` is
+    true. Otherwise, or if the call fails (no tool call, invalid arguments,
+    throttling, ...), the same input goes to ``large``. Bedrock returns no
+    token probabilities, so ``accept`` is the node's confidence check: a
+    validation of the answer that the node's own logic relies on.
+
+    A cascade only pays off while the small model is usually enough. Once
+    more than ``max_escalation_rate`` of the node's last calls escalated
+    (with at least ``min_samples`` of them), calls go straight to the large
+    model, except one in ``probe_every`` that keeps measuring the rate.
+    """
+
+    def __init__(
+        self,
+        node: str,
+        small: Any,
+        large: Any,
+        accept: Optional[Accept] = None,
+        max_escalation_rate: float = 0.5,
+        min_samples: int = 20,
+        probe_every: int = 10,
+        stats: Optional[CascadeStats] = None,
+    ):
+        self.node = node
+        self.small = small
+        self.large = large
+        self.accept = accept or _accept_any
+        self.max_escalation_rate = max_escalation_rate
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+        self.stats = stats or _stats
+        self._skips = 0
+        self._lock = threading.Lock()
+
+    def _skip_small(self) -> bool:
+        if self.stats.samples(self.node) < self.min_samples:
+            return False
+        if self.stats.escalation_rate(self.node) <= self.max_escalation_rate:
+            return False
+        with self._lock:
+            self._skips += 1
+            return self._skips % self.probe_every != 0
+
+    def _large(self, input: Any, config: Optional[Dict[str, Any]], outcome: str, small_seconds: Optional[float]) -> Any:
+        started = time.perf_counter()
+        result = self.large.invoke(input, config)
+        self.stats.record(self.node, outcome, small_seconds, time.perf_counter() - started)
+        return result
+
+    def invoke(self, input: Any, config: Optional[Dict[str, Any]] = None) -> Any:
+        if self._skip_small():
+            return self._large(input, config, "skipped", None)
+        started = time.perf_counter()
+        try:
+            result = self.small.invoke(input, config)
+        except Exception:
+            return self._large(input, config, "error", time.perf_counter() - started)
+        small_seconds = time.perf_counter() - started
+        if not self.accept(result):
+            return self._large(input, config, "rejected", small_seconds)
+        self.stats.record(self.node, "accepted", small_seconds, None)
+        return result
+
+
+def model_cascade(node: str, derive: Callable[[Any], Any], accept: Optional[Accept] = None, **client_kwargs: Any) -> Any:
+    """Runnable for ``node``'s calls: ``derive(client)`` on a cascade of models.
+
+    ``derive`` turns a chat client into what the node calls, e.g.
+    ``lambda llm: llm.with_structured_output(Route)``, and ``client_kwargs``
+    go to both clients (``temperature``, ``max_tokens``). Unless ``node`` is
+    in ``LLM_CASCADE_NODES``, this is just ``derive`` of the large model.
+    """
+    registry = get_client_registry()
+    large = derive(registry.get(settings.CLAUDE_3_7_SONNET_MODEL_ID, **client_kwargs))
+    if node not in settings.LLM_CASCADE_NODES:
+        return large
+    from langchain_core.runnables import RunnableLambda
+
+    small = derive(registry.get(settings.LLM_CASCADE_MODEL_ID, **client_kwargs))
+    cascade = Cascade(
+        node,
+        small,
+        large,
+        accept,
+        max_escalation_rate=settings.LLM_CASCADE_MAX_ESCALATION_RATE,
+        min_samples=settings.LLM_CASCADE_MIN_SAMPLES,
+    )
+    return RunnableLambda(cascade.invoke, name=f"cascade:{node}")
+
+
+def collect_cascade_metrics(metrics) -> None:
+    """Copy :func:`cascade_stats` into a ``utils.tracing.Metrics`` registry."""
+    for node, stats in cascade_stats().items():
+        metrics.set("llm_cascade_calls_total", "Calls from nodes with a model cascade", stats["calls"], "counter", node=node)
+        metrics.set("llm_cascade_escalations_total", "Calls escalated to the large model", stats["escalated"], "counter", node=node)
+        metrics.set("llm_cascade_skipped_total", "Calls sent straight to the large model", stats["skipped"], "counter", node=node)
+        metrics.set("llm_cascade_escalation_rate", "Share of small-model answers that escalated", stats["escalation_rate"], node=node)
+        if stats["saved_seconds"] is not None:
+            metrics.set("llm_cascade_saved_seconds", "Estimated model time saved against the large model alone", stats["saved_seconds"], node=node)
+            metrics.set("llm_cascade_saved_ratio", "Estimated share of model time saved", stats["saved_ratio"], node=node)
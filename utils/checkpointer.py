@@ -0,0 +1,457 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+Typed = Tuple[str, bytes]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class _Latest:
+    """Serialized latest checkpoint of one thread, as kept in the LRU."""
+
+    __slots__ = ("checkpoint_id", "parent_id", "checkpoint", "metadata", "blobs", "writes")
+
+    def __init__(self, checkpoint_id, parent_id, checkpoint, metadata, blobs, writes):
+        self.checkpoint_id: str = checkpoint_id
+        self.parent_id: Optional[str] = parent_id
+        self.checkpoint: Typed = checkpoint
+        self.metadata: Typed = metadata
+        self.blobs: Dict[str, Typed] = blobs
+        self.writes: Dict[Tuple[str, int], Tuple[str, str, Typed, str]] = writes
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """Durable LangGraph checkpointer backed by one SQLite file.
+
+    Like the in-memory saver, channel values are stored once per version, so
+    each step only writes the channels it changed (``new_versions``) plus a
+    small checkpoint row, all in one transaction. The latest checkpoint of the
+    ``max_cached_threads`` most recently used threads is kept in an LRU, in
+    serialized form; any other thread is loaded from disk the next time it is
+    used, so memory stays flat however many threads exist. Every
+    ``compact_every`` checkpoints, a thread's chain is cut down to its last
+    ``keep_checkpoints`` checkpoints and the channel versions nothing
+    references any more are deleted.
+
+    The file can be shared by several processes, but the LRU assumes that a
+    given thread is only advanced by one process at a time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_cached_threads: int = 1024,
+        keep_checkpoints: Optional[int] = 20,
+        compact_every: int = 50,
+        *,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.max_cached_threads = max_cached_threads
+        self.keep_checkpoints = keep_checkpoints
+        self.compact_every = compact_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._latest: "OrderedDict[Tuple[str, str], _Latest]" = OrderedDict()
+        self._puts_since_compaction: Dict[Tuple[str, str], int] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ----- LRU of latest checkpoints -----
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[_Latest]:
+        with self._lock:
+            latest = self._latest.get(key)
+            if latest is not None:
+                self._latest.move_to_end(key)
+            return latest
+
+    def _cache_put(self, key: Tuple[str, str], latest: Optional[_Latest]) -> None:
+        with self._lock:
+            if latest is None:
+                self._latest.pop(key, None)
+                return
+            self._latest[key] = latest
+            self._latest.move_to_end(key)
+            while len(self._latest) > self.max_cached_threads:
+                self._latest.popitem(last=False)
+
+    def cached_threads(self) -> int:
+        with self._lock:
+            return len(self._latest)
+
+    # ----- reading -----
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, latest: _Latest) -> CheckpointTuple:
+        checkpoint: Checkpoint = self.serde.loads_typed(latest.checkpoint)
+        channel_values = {
+            channel: self.serde.loads_typed(value)
+            for channel, value in latest.blobs.items()
+            if value[0] != "empty"
+        }
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": latest.checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self.serde.loads_typed(latest.metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": latest.parent_id}}
+                if latest.parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed(value))
+                for task_id, channel, value, _ in latest.writes.values()
+            ],
+        )
+
+    def _load(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str, row: tuple) -> _Latest:
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        versions = self.serde.loads_typed((type_, checkpoint))["channel_versions"]
+        blobs = {}
+        for channel, version in versions.items():
+            blob = conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if blob is not None:
+                blobs[channel] = (blob[0], blob[1])
+        writes = {
+            (task_id, idx): (task_id, channel, (value_type, value), task_path)
+            for task_id, idx, channel, value_type, value, task_path in conn.execute(
+                "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        }
+        return _Latest(checkpoint_id, parent_id, (type_, checkpoint), (metadata_type, metadata), blobs, writes)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id: str = config["configurable"]["thread_id"]
+        checkpoint_ns: str = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+
+        latest = self._cache_get(key)
+        if latest is not None and checkpoint_id in (None, latest.checkpoint_id):
+            return self._tuple(thread_id, checkpoint_ns, latest)
+
+        conn = self._connection()
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        if checkpoint_id:
+            row = conn.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+        if row is None:
+            return None
+        loaded = self._load(conn, thread_id, checkpoint_ns, row)
+        if not checkpoint_id:
+            self._cache_put(key, loaded)
+        return self._tuple(thread_id, checkpoint_ns, loaded)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        clauses: List[str] = []
+        params: List[Any] = []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        conn = self._connection()
+        for thread_id, checkpoint_ns, *row in conn.execute(query, params).fetchall():
+            if filter:
+                metadata = self.serde.loads_typed((row[4], row[5]))
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit -= 1
+            yield self._tuple(thread_id, checkpoint_ns, self._load(conn, thread_id, checkpoint_ns, tuple(row)))
+
+    # ----- writing -----
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id")
+        key = (thread_id, checkpoint_ns)
+
+        stored = checkpoint.copy()
+        values: Dict[str, Any] = stored.pop("channel_values")
+        new_blobs = {
+            channel: self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")
+            for channel in new_versions
+        }
+        checkpoint_typed = self.serde.dumps_typed(stored)
+        metadata_typed = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, value) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (thread_id, checkpoint_ns, channel, str(version), *new_blobs[channel])
+                    for channel, version in new_versions.items()
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, *checkpoint_typed, *metadata_typed),
+            )
+
+        # The unchanged channels can be taken from the cached parent; without
+        # it the entry is dropped and the next read loads it from disk.
+        previous = self._cache_get(key)
+        if previous is not None and previous.checkpoint_id == parent_id:
+            blobs = {
+                channel: new_blobs.get(channel, previous.blobs.get(channel))
+                for channel in checkpoint["channel_versions"]
+                if channel in new_blobs or channel in previous.blobs
+            }
+            self._cache_put(key, _Latest(checkpoint["id"], parent_id, checkpoint_typed, metadata_typed, blobs, {}))
+        else:
+            self._cache_put(key, None)
+
+        with self._lock:
+            count = self._puts_since_compaction.get(key, 0) + 1
+            self._puts_since_compaction[key] = count
+        if self.keep_checkpoints and count >= self.compact_every:
+            self.compact(thread_id, checkpoint_ns)
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            rows.append((WRITES_IDX_MAP.get(channel, idx), channel, self.serde.dumps_typed(value)))
+        # Special writes (errors, interrupts, ...) replace earlier ones; regular
+        # writes of a task are never overwritten, as in the in-memory saver.
+        with self._connection() as conn:
+            for idx, channel, value in rows:
+                conn.execute(
+                    f"INSERT OR {'REPLACE' if idx < 0 else 'IGNORE'} INTO writes "
+                    "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, *value, task_path),
+                )
+
+        latest = self._cache_get((thread_id, checkpoint_ns))
+        if latest is not None and latest.checkpoint_id == checkpoint_id:
+            with self._lock:
+                # Copy on write: readers may be iterating the current dict
+                pending = dict(latest.writes)
+                for idx, channel, value in rows:
+                    if idx < 0 or (task_id, idx) not in pending:
+                        pending[(task_id, idx)] = (task_id, channel, value, task_path)
+                latest.writes = pending
+
+    def compact(self, thread_id: str, checkpoint_ns: str = "") -> int:
+        """Delete all but the last ``keep_checkpoints`` checkpoints of a thread.
+
+        Returns the number of checkpoints removed.
+        """
+        with self._lock:
+            self._puts_since_compaction.pop((thread_id, checkpoint_ns), None)
+        if not self.keep_checkpoints:
+            return 0
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC",
+                (thread_id, checkpoint_ns),
+            ).fetchall()
+            kept, removed = rows[: self.keep_checkpoints], [row[0] for row in rows[self.keep_checkpoints:]]
+            if not removed:
+                return 0
+
+            conn.executemany(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in removed],
+            )
+            conn.executemany(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in removed],
+            )
+            # The oldest kept checkpoint is now the root of the chain
+            conn.execute(
+                "UPDATE checkpoints SET parent_checkpoint_id = NULL WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, kept[-1][0]),
+            )
+
+            referenced = {
+                (channel, str(version))
+                for _, type_, checkpoint in kept
+                for channel, version in self.serde.loads_typed((type_, checkpoint))["channel_versions"].items()
+            }
+            stale = [
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in conn.execute(
+                    "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns),
+                )
+                if (channel, version) not in referenced
+            ]
+            conn.executemany(
+                "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", stale
+            )
+        return len(removed)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._connection() as conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        with self._lock:
+            for key in [key for key in self._latest if key[0] == thread_id]:
+                del self._latest[key]
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ----- async API: SQLite calls are short, so they run on the default executor -----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,92 @@
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from utils.llm_client import call_deadline, is_timeout
+
+Payload = Dict[str, Any]
+
+
+class PriorityGate:
+    """At most ``slots`` holders at a time; waiters get in highest priority first."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._free = slots
+        self._waiting: List[tuple] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, priority: float = 0.0) -> Iterator[None]:
+        with self._condition:
+            entry = (-priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            while self._free == 0 or self._waiting[0] != entry:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._free -= 1
+            # The next waiter in line may fit as well
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._free += 1
+                self._condition.notify_all()
+
+
+class FanOutScheduler:
+    """Schedules a ``Send`` fan-out for a short makespan under a concurrency cap.
+
+    :meth:`sends` orders the payloads longest-expected-first (``size``), the
+    classic heuristic for finishing a set of parallel jobs as early as
+    possible: the longest job starts first instead of last. The node wrapped
+    by :meth:`worker` holds one of ``max_in_flight`` slots while it runs,
+    handed out by the same priority, so a large fan-out stays within the rate
+    limits without the longest job queueing behind short ones. The gate is
+    shared by every run of the graph in this process.
+
+    ``deadline(payload)`` gives each worker's model calls a deadline in
+    seconds (``None`` keeps the node's default from ``NODE_DEADLINES``). A
+    worker that runs out of time returns ``on_timeout(payload, error)``
+    instead of failing the whole run, if that is given.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        size: Callable[[Payload], float] = lambda payload: 0.0,
+        deadline: Optional[Callable[[Payload], Optional[float]]] = None,
+        on_timeout: Optional[Callable[[Payload, BaseException], Any]] = None,
+    ):
+        self.size = size
+        self.deadline = deadline
+        self.on_timeout = on_timeout
+        self.gate = PriorityGate(max_in_flight)
+
+    def sends(self, node: str, payloads: Sequence[Payload]) -> List[Any]:
+        """``Send`` objects for ``payloads``, largest first."""
+        from langgraph.types import Send
+
+        return [Send(node, payload) for payload in sorted(payloads, key=self.size, reverse=True)]
+
+    def worker(self, func: Callable[[Payload], Any]) -> Callable[[Payload], Any]:
+        """Wrap the node function that receives the sent payloads."""
+
+        def scheduled(payload: Payload) -> Any:
+            seconds = self.deadline(payload) if self.deadline else None
+            with self.gate.slot(self.size(payload)):
+                try:
+                    with call_deadline(seconds) if seconds else nullcontext():
+                        return func(payload)
+                except Exception as error:
+                    if self.on_timeout is None or not is_timeout(error):
+                        raise
+                    return self.on_timeout(payload, error)
+
+        scheduled.__name__ = getattr(func, "__name__", "worker")
+        scheduled.__doc__ = func.__doc__
+        return scheduled
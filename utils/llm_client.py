@@ -1,32 +1,799 @@
-from langchain_aws import ChatBedrock, ChatBedrockConverse
+import copy
+import os
+import threading
+import time
 from abc import abstractmethod
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import settings
-from botocore.config import Config
 
-from utils.singleton import Singleton 
+from utils.rate_limiter import AdaptiveRateLimiter, SharedStateStore
 
-config = Config(read_timeout=1000, max_pool_connections=50)
+if TYPE_CHECKING:
+    from langchain_core.runnables import Runnable
+    from utils.response_cache import SQLiteResponseCache
+    from utils.semantic_cache import SemanticCache
 
-class ChatClientFactory(metaclass=Singleton):
+# langchain_aws, boto3 and langchain_core take about a second to import, so
+# they are only loaded once the first client (or cache) is actually created.
+
+_configs: Dict[float, Any] = {}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+_response_cache: Optional["SQLiteResponseCache"] = None
+_response_cache_lock = threading.Lock()
+
+_semantic_cache: Optional["SemanticCache"] = None
+_semantic_cache_lock = threading.Lock()
+
+_rate_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+_single_flight: Optional["SingleFlight"] = None
+_single_flight_lock = threading.Lock()
+
+_hedger: Optional["Hedger"] = None
+_hedger_lock = threading.Lock()
+
+_deadline = threading.local()
+
+# max_tokens by graph node, declared by the workflow modules (see output_budget)
+_output_budgets: Dict[str, int] = {}
+
+
+def pool_size() -> int:
+    """Connections per Bedrock client: ``LLM_MAX_POOL_CONNECTIONS`` or concurrency plus headroom."""
+    return settings.LLM_MAX_POOL_CONNECTIONS or settings.LLM_MAX_CONCURRENCY + settings.LLM_POOL_HEADROOM
+
+
+def get_bedrock_config(read_timeout: Optional[float] = None):
+    """botocore client config shared by every Bedrock client with this read timeout."""
+    read_timeout = read_timeout or settings.LLM_DEFAULT_DEADLINE_SECONDS
+    if read_timeout not in _configs:
+        from botocore.config import Config
+
+        # Throttling is retried by the rate limiter, which backs off for every worker at
+        # once; letting botocore retry on its own as well is what causes retry storms.
+        # The limiter also retries server errors and dropped connections (is_transient_error).
+        _configs[read_timeout] = Config(
+            read_timeout=read_timeout,
+            max_pool_connections=pool_size(),
+            retries={"mode": "standard", "total_max_attempts": 1},
+        )
+    return _configs[read_timeout]
+
+
+def node_deadline(node: Optional[str]) -> float:
+    """Deadline (seconds) for one model call made from graph node ``node``."""
+    return settings.NODE_DEADLINES.get(node, settings.LLM_DEFAULT_DEADLINE_SECONDS)
+
+
+def output_budget(node: str, max_tokens: int) -> None:
+    """Cap the output of every model call made from graph node ``node`` at ``max_tokens``.
+
+    Called by the workflow modules next to the node definitions. Budgets are
+    per node name and only ever lower a client's ``max_tokens``;
+    ``NODE_OUTPUT_BUDGETS`` in ``settings.py`` overrides them.
+    """
+    _output_budgets[node] = max_tokens
+
+
+def node_output_budget(node: Optional[str]) -> Optional[int]:
+    """Output budget (max_tokens) for model calls made from graph node ``node``, if it has one."""
+    return settings.NODE_OUTPUT_BUDGETS.get(node) or _output_budgets.get(node)
+
+
+def output_budgets() -> Dict[str, int]:
+    """Every node's output budget, declared or overridden."""
+    return {**_output_budgets, **settings.NODE_OUTPUT_BUDGETS}
+
+
+def current_deadline() -> Optional[float]:
+    """The deadline this thread is inside of (see :func:`call_deadline`), if any."""
+    return getattr(_deadline, "seconds", None)
+
+
+def deadline_expires() -> Optional[float]:
+    """``time.monotonic()`` at which the enclosing :func:`call_deadline` runs out, if any."""
+    return getattr(_deadline, "expires", None)
+
+
+@contextmanager
+def call_deadline(seconds: float, expires: Optional[float] = None) -> Iterator[None]:
+    """Send the Bedrock requests this thread makes with a ``seconds`` read timeout.
+
+    A request that is still waiting for the rate limiter at ``expires``
+    (``time.monotonic()``, by default ``seconds`` from now, and never later
+    than an enclosing deadline) is not sent but fails with ``TimeoutError``.
+    """
+    previous = getattr(_deadline, "seconds", None), getattr(_deadline, "expires", None)
+    expires = time.monotonic() + seconds if expires is None else expires
+    _deadline.seconds = seconds
+    _deadline.expires = expires if previous[1] is None else min(expires, previous[1])
+    try:
+        yield
+    finally:
+        _deadline.seconds, _deadline.expires = previous
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Whether ``error`` is a model call running out of its deadline."""
+    # botocore's ReadTimeoutError does not derive from TimeoutError
+    return isinstance(error, TimeoutError) or type(error).__name__ == "ReadTimeoutError"
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Thread pool behind the async client API, sized to the in-flight limit.
+
+    boto3 is synchronous, so every Bedrock call needs a thread. Using one pool
+    of ``LLM_MAX_CONCURRENCY`` workers (instead of the event loop's default
+    executor, which is capped at ``cpu_count + 4``) keeps the botocore
+    connection pool full without spawning a thread per request.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.LLM_MAX_CONCURRENCY,
+                    thread_name_prefix="bedrock",
+                )
+    return _executor
+
+
+def get_response_cache() -> Optional["SQLiteResponseCache"]:
+    """Shared on-disk response cache, or ``None`` unless ``LLM_CACHE_PATH`` is set."""
+    global _response_cache
+    if _response_cache is None and settings.LLM_CACHE_PATH:
+        with _response_cache_lock:
+            if _response_cache is None:
+                from utils.response_cache import SQLiteResponseCache
+
+                _response_cache = SQLiteResponseCache(
+                    settings.LLM_CACHE_PATH,
+                    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+                    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                )
+    return _response_cache
+
+
+def get_semantic_cache() -> Optional["SemanticCache"]:
+    """Shared similarity cache in front of the response cache, or ``None`` unless ``SEMANTIC_CACHE_NODES`` is set."""
+    global _semantic_cache
+    if _semantic_cache is None and settings.SEMANTIC_CACHE_NODES:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                from utils.semantic_cache import SemanticCache
+
+                _semantic_cache = SemanticCache(
+                    settings.SEMANTIC_CACHE_NODES,
+                    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                    exact=get_response_cache(),
+                    audit_rate=settings.SEMANTIC_CACHE_AUDIT_RATE,
+                    audit_path=settings.SEMANTIC_CACHE_AUDIT_PATH,
+                )
+    return _semantic_cache
+
+
+def get_rate_limiter(model_id: str) -> AdaptiveRateLimiter:
+    """Rate limiter for ``model_id``, configured from ``LLM_RATE_LIMITS``."""
+    with _rate_limiters_lock:
+        if model_id not in _rate_limiters:
+            limits = settings.LLM_RATE_LIMITS.get(model_id, {})
+            _rate_limiters[model_id] = AdaptiveRateLimiter(
+                model_id,
+                SharedStateStore(settings.LLM_RATE_LIMIT_STATE_PATH),
+                requests_per_minute=limits.get("requests_per_minute"),
+                tokens_per_minute=limits.get("tokens_per_minute"),
+                max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            )
+        return _rate_limiters[model_id]
+
+
+class SingleFlight:
+    """Lets concurrent identical calls share one call in flight.
+
+    The first caller with a key makes the call. Callers arriving with the
+    same key before it finishes wait for it and get a copy of its result (or
+    its exception) instead of making their own. Nothing is kept after the
+    call finishes; that is the response cache's job.
+
+    Each waiter still keeps its own deadline: it stops waiting with
+    ``TimeoutError`` after ``timeout`` seconds. If the call itself runs out
+    of time, the caller's deadline may have been shorter than theirs, so the
+    waiters make the call again (one of them leads) instead of failing too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [future, number of callers waiting on it]
+        self._calls: Dict[str, List[Any]] = {}
+        self._counters = {"requests": 0, "coalesced": 0}
+
+    def _join(self, key: str, retry: bool = False) -> Tuple[Future, bool]:
+        with self._lock:
+            if not retry:
+                self._counters["requests"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call[1] += 1
+                self._counters["coalesced"] += 1
+                return call[0], False
+            future: Future = Future()
+            self._calls[key] = [future, 0]
+            return future, True
+
+    def _settle(self, key: str, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            future, waiters = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            # The caller's copy is about to be annotated by LangChain
+            future.set_result(copy.deepcopy(result) if waiters else None)
+
+    @staticmethod
+    def _expired(timeout: Optional[float]) -> TimeoutError:
+        return TimeoutError(f"Gave up waiting for an identical model call after {timeout:g}s")
+
+    def call(self, key: str, func: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """``func()``, or the result of the identical call in flight; and whether it was shared.
+
+        A shared call is waited for at most ``timeout`` seconds.
+        """
+        expires = time.monotonic() + timeout if timeout else None
+        future, leader = self._join(key)
+        while not leader:
+            try:
+                return copy.deepcopy(future.result(expires and max(0.0, expires - time.monotonic()))), True
+            except BaseException as error:
+                if not future.done():
+                    raise self._expired(timeout) from None
+                if not is_timeout(error):
+                    raise
+            # The call ran out of its own deadline; this caller may have more time
+            future, leader = self._join(key, retry=True)
+        try:
+            result = func()
+        except BaseException as error:
+            self._settle(key, error=error)
+            raise
+        self._settle(key, result)
+        return result, False
+
+    async def acall(self, key: str, func: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Async :meth:`call`: waiting for a shared call does not hold a thread."""
+        import asyncio
+
+        expires = time.monotonic() + timeout if timeout else None
+        future, leader = self._join(key)
+        while not leader:
+            try:
+                # Shielded: giving up must not cancel the call the others wait for
+                waiting = asyncio.shield(asyncio.wrap_future(future))
+                result = await asyncio.wait_for(waiting, expires and max(0.0, expires - time.monotonic()))
+                return copy.deepcopy(result), True
+            except BaseException as error:
+                if not future.done():
+                    raise self._expired(timeout) from None
+                if not is_timeout(error):
+                    raise
+            future, leader = self._join(key, retry=True)
+        try:
+            result = await func()
+        except BaseException as error:
+            self._settle(key, error=error)
+            raise
+        self._settle(key, result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls made through this instance, how many were coalesced, and the ratio."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._calls)
+        stats["coalescing_ratio"] = stats["coalesced"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Single-flight layer shared by every client, or ``None`` when ``LLM_SINGLE_FLIGHT`` is off."""
+    global _single_flight
+    if _single_flight is None and settings.LLM_SINGLE_FLIGHT:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
+
+
+class Hedger:
+    """Sends a second, identical request when a call is slower than usual.
+
+    Only calls from graph nodes in ``nodes`` are hedged. Once a node has
+    ``min_samples`` observed latencies, a call from it still running after
+    the node's ``quantile`` latency gets a duplicate request, and whichever
+    answers first is used. A boto3 call cannot be aborted, so the loser is
+    cancelled only if it has not started yet. Otherwise it is detached, and
+    its latency is still recorded when it finishes. At most ``budget`` of
+    all calls are hedged, because every hedge is a full extra request.
+
+    ``request(on_sent)`` must call ``on_sent()`` right before it sends the
+    request, i.e. once the rate limiter let it through. Latencies are
+    measured from there, and the hedge delay only starts once the original
+    request was sent: a call queued in the limiter is not slow, the limiter
+    is shedding load, and a hedge would only add to it. The duplicate is
+    made with ``duplicate`` (default: ``request`` again), e.g. without the
+    caller's callbacks so that the losing request reports nothing.
+    """
+
+    def __init__(
+        self,
+        nodes: Iterable[str],
+        quantile: float = 0.95,
+        budget: float = 0.05,
+        min_samples: int = 20,
+        window: int = 500,
+    ):
+        self.nodes = frozenset(nodes)
+        self.quantile = quantile
+        self.budget = budget
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0})
+        self._calls = self._hedged = 0
+        # Separate from get_executor(): async calls already hold one of its threads while they wait here
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def delay(self, node: str) -> Optional[float]:
+        """Seconds after which a call from ``node`` is hedged, or ``None`` while it has too few samples."""
+        with self._lock:
+            samples = sorted(self._latencies[node])
+        if len(samples) < self.min_samples:
+            return None
+        return samples[int(self.quantile * (len(samples) - 1))]
+
+    def _timed(self, node: str, request: Callable[[Callable[[], None]], Any], sent: Optional[threading.Event] = None) -> Any:
+        sent_at: List[float] = []
+
+        def on_sent() -> None:
+            # Called again for a retry after a throttle, which restarts the clock
+            sent_at[:] = [time.perf_counter()]
+            if sent is not None:
+                sent.set()
+
+        try:
+            result = request(on_sent)
+        finally:
+            if sent is not None:
+                # Also when the request failed before it was sent
+                sent.set()
+        if sent_at:
+            with self._lock:
+                self._latencies[node].append(time.perf_counter() - sent_at[0])
+        return result
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * settings.LLM_MAX_CONCURRENCY, thread_name_prefix="bedrock-hedge"
+                )
+            return self._executor
+
+    def call(
+        self,
+        node: Optional[str],
+        request: Callable[[Callable[[], None]], Any],
+        duplicate: Optional[Callable[[Callable[[], None]], Any]] = None,
+    ) -> Tuple[Any, Optional[bool]]:
+        """``request(on_sent)``, hedged if ``node`` is enabled and slow; and whether the hedge won (``None``: not hedged)."""
+        if node not in self.nodes:
+            return request(lambda: None), None
+        with self._lock:
+            self._calls += 1
+            self._counters[node]["calls"] += 1
+        delay = self.delay(node)
+        if delay is None:
+            return self._timed(node, request), None
+
+        sent = threading.Event()
+        primary = self._pool().submit(self._timed, node, request, sent)
+        sent.wait()
+        if wait([primary], timeout=delay).done:
+            return primary.result(), None
+        with self._lock:
+            allowed = self._hedged < self.budget * self._calls
+            if allowed:
+                self._hedged += 1
+                self._counters[node]["hedged"] += 1
+        if not allowed:
+            return primary.result(), None
+
+        hedge = self._pool().submit(self._timed, node, duplicate or request)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        # On a tie the primary wins; a failed first answer leaves the other to try
+        first = primary if primary in done else hedge
+        if first.exception() is not None:
+            first = hedge if first is primary else primary
+        (hedge if first is primary else primary).cancel()
+        result = first.result()
+        won = first is hedge
+        if won:
+            with self._lock:
+                self._counters[node]["hedge_wins"] += 1
+        return result, won
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per node: calls, hedges sent, hedges that answered first, the hedge and win rates, and the current delay."""
+        with self._lock:
+            counters = {node: dict(values) for node, values in self._counters.items()}
+        for node, stats in counters.items():
+            stats["hedge_rate"] = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+            stats["win_rate"] = stats["hedge_wins"] / stats["hedged"] if stats["hedged"] else 0.0
+            stats["delay"] = self.delay(node)
+        return counters
+
+
+def get_hedger() -> Optional[Hedger]:
+    """Hedging shared by every client, or ``None`` unless ``LLM_HEDGE_NODES`` is set."""
+    global _hedger
+    if _hedger is None and settings.LLM_HEDGE_NODES:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger(
+                    settings.LLM_HEDGE_NODES,
+                    quantile=settings.LLM_HEDGE_QUANTILE,
+                    budget=settings.LLM_HEDGE_BUDGET,
+                    min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+                )
+    return _hedger
+
+
+def batch(
+    runnable: "Runnable",
+    inputs: Iterable[Any],
+    max_concurrency: Optional[int] = None,
+    return_exceptions: bool = False,
+    config: Optional[Dict[str, Any]] = None,
+) -> List[Any]:
+    """Invoke ``runnable`` on every input with a bounded number of calls in flight.
+
+    Works for a client as well as anything derived from it
+    (``with_structured_output``, ``bind_tools``, prompts piped into it, ...).
+    Results are returned in input order. ``config`` goes to every call; outside
+    a graph, give it ``{"metadata": {"langgraph_node": ...}}`` so the calls
+    get that node's output budget, deadline and tracing.
+    """
+    return runnable.batch(
+        list(inputs),
+        config={**(config or {}), "max_concurrency": max_concurrency or settings.LLM_MAX_CONCURRENCY},
+        return_exceptions=return_exceptions,
+    )
+
+
+async def abatch(
+    runnable: "Runnable",
+    inputs: Iterable[Any],
+    max_concurrency: Optional[int] = None,
+    return_exceptions: bool = False,
+    config: Optional[Dict[str, Any]] = None,
+) -> List[Any]:
+    """Async counterpart of :func:`batch`."""
+    return await runnable.abatch(
+        list(inputs),
+        config={**(config or {}), "max_concurrency": max_concurrency or settings.LLM_MAX_CONCURRENCY},
+        return_exceptions=return_exceptions,
+    )
+
+
+def _per_request_read_timeout() -> bool:
+    # Newer botocore reads a "read_timeout" from the request context; older
+    # versions ignore it and use the client's
+    from botocore.httpsession import URLLib3Session
+
+    return hasattr(URLLib3Session, "_get_request_timeout")
+
+
+def _set_read_timeout(context: Dict[str, Any], **kwargs: Any) -> None:
+    context["read_timeout"] = current_deadline() or settings.LLM_DEFAULT_DEADLINE_SECONDS
+
+
+class DeadlineClient:
+    """``bedrock-runtime`` client whose read timeout follows the caller's deadline.
+
+    Each call gets the :func:`call_deadline` of its thread as its read
+    timeout. Where botocore takes a read timeout per request, one client
+    (and one connection pool) serves every deadline. Older botocore fixes it
+    per client, so there is then one client per deadline in use, each created
+    by ``create(read_timeout)`` with a pool of its own: at most one per
+    distinct value in ``NODE_DEADLINES``, ``LLM_DEFAULT_DEADLINE_SECONDS`` and
+    the deadlines given to :func:`call_deadline`. Connections on the wire
+    stay bounded by ``LLM_MAX_CONCURRENCY`` across all of them, but each pool
+    keeps up to :func:`pool_size` idle ones; :func:`pool_stats` reports
+    every pool.
+    """
+
+    def __init__(self, create: Callable[[float], Any], shared: Optional[bool] = None):
+        self._create = create
+        self._shared = _per_request_read_timeout() if shared is None else shared
+        self._clients: Dict[float, Any] = {}
+        self._lock = threading.Lock()
+
+    def client(self, read_timeout: Optional[float] = None):
+        if self._shared:
+            # Created with the default; each request then sets its own
+            read_timeout = settings.LLM_DEFAULT_DEADLINE_SECONDS
+        else:
+            read_timeout = read_timeout or current_deadline() or settings.LLM_DEFAULT_DEADLINE_SECONDS
+        client = self._clients.get(read_timeout)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(read_timeout)
+                if client is None:
+                    client = self._create(read_timeout)
+                    if self._shared:
+                        client.meta.events.register("before-call.bedrock-runtime", _set_read_timeout)
+                    self._clients[read_timeout] = client
+        return client
+
+    @property
+    def clients(self) -> Dict[float, Any]:
+        """The botocore clients created so far, by read timeout (a single one when shared)."""
+        return dict(self._clients)
+
+    def invoke_model(self, **kwargs: Any) -> Dict[str, Any]:
+        return self.client().invoke_model(**kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs: Any) -> Dict[str, Any]:
+        return self.client().invoke_model_with_response_stream(**kwargs)
+
+
+class ClientRegistry:
+    """Process-wide registry of chat clients, one per configuration.
+
+    Clients are keyed on ``(model_id, thinking, max_tokens, temperature,
+    region)`` and built exactly once under a lock. Every client of a region
+    wraps the same :class:`DeadlineClient`, whose boto3 clients come from one
+    boto3 session, so mixing configurations shares connection pools and loads
+    the service model once. After ``fork`` the child starts with an empty
+    registry, because sockets and locks inherited from the parent are unsafe.
+    """
+
+    def __init__(self):
+        self._runtime_client_factory: Optional[Callable[[str], Any]] = None
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._session_lock = threading.Lock()
+        self._clients = {}
+        self._runtime_clients = {}
+        self._session = None
+
+    def set_runtime_client_factory(self, factory: Optional[Callable[[str], Any]]) -> None:
+        """Build ``bedrock-runtime`` clients with ``factory(region)`` instead of boto3.
+
+        Used to run the workflows against a local backend (see ``benchmarks/``);
+        ``None`` restores boto3. Clients created so far are dropped, and so are
+        the rate limiters: a different backend has its own limits, and the
+        next ones read ``LLM_RATE_LIMITS`` and the state path anew.
+        """
+        with self._lock:
+            self._runtime_client_factory = factory
+            self._clients.clear()
+            self._runtime_clients.clear()
+        with _rate_limiters_lock:
+            _rate_limiters.clear()
+
+    def runtime_clients(self) -> Dict[str, Any]:
+        """The ``bedrock-runtime`` clients created so far, by region."""
+        with self._lock:
+            return dict(self._runtime_clients)
+
+    def _boto3_client(self, region: str, read_timeout: float):
+        from utils.prompt_cache import register_response_hooks
+
+        # boto3 sessions are not thread-safe
+        with self._session_lock:
+            if self._session is None:
+                import boto3
+
+                self._session = boto3.Session()
+            client = self._session.client("bedrock-runtime", region_name=region, config=get_bedrock_config(read_timeout))
+        register_response_hooks(client)
+        return client
+
+    def _runtime_client(self, region: str):
+        # Called with the lock held
+        if region not in self._runtime_clients:
+            if self._runtime_client_factory is not None:
+                from utils.prompt_cache import register_response_hooks
+
+                client = self._runtime_client_factory(region)
+                register_response_hooks(client)
+            else:
+                client = DeadlineClient(partial(self._boto3_client, region))
+            self._runtime_clients[region] = client
+        return self._runtime_clients[region]
+
+    def _build(self, model_id, thinking, max_tokens, temperature, region):
+        from utils.bedrock_chat import BedrockChatModel
+        from utils.tracing import tracing_callbacks
+
+        model_kwargs = {}
+        if thinking:
+            if temperature is not None:
+                raise ValueError("Extended thinking requires the default temperature")
+            if max_tokens <= settings.THINKING_BUDGET_TOKENS:
+                raise ValueError(
+                    f"max_tokens ({max_tokens}) must exceed THINKING_BUDGET_TOKENS "
+                    f"({settings.THINKING_BUDGET_TOKENS}) when thinking is enabled"
+                )
+            model_kwargs["thinking"] = {"type": "enabled", "budget_tokens": settings.THINKING_BUDGET_TOKENS}
+
+        return BedrockChatModel(
+            model_id=model_id,
+            region_name=region,
+            client=self._runtime_client(region),
+            config=get_bedrock_config(),
+            cache=get_semantic_cache() or get_response_cache(),
+            limiter=get_rate_limiter(model_id),
+            single_flight=get_single_flight(),
+            hedger=get_hedger(),
+            callbacks=tracing_callbacks(),
+            max_tokens=max_tokens,
+            temperature=temperature,
+            model_kwargs=model_kwargs,
+        )
+
+    def get(
+        self,
+        model_id: str,
+        thinking: bool = False,
+        max_tokens: int = 8192,
+        temperature: Optional[float] = None,
+        region: Optional[str] = None,
+    ):
+        """Client for this configuration, created on first request"""
+        key = (model_id, thinking, max_tokens, temperature, region or settings.AWS_REGION)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self._build(*key)
+        return client
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    return _registry
+
+
+def _connection_pools(client) -> Iterator[Any]:
+    # botocore keeps its urllib3 pool managers on the endpoint's HTTP session
+    session = getattr(getattr(client, "_endpoint", None), "http_session", None)
+    managers = [getattr(session, "_manager", None), *getattr(session, "_proxy_managers", {}).values()]
+    for manager in filter(None, managers):
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is not None:
+                yield pool
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Occupancy of the Bedrock connection pools and of the queues in front of them.
+
+    Per pool: ``max_connections``, ``checked_out`` (requests on the wire),
+    ``idle`` connections kept for reuse, and the running totals of
+    ``connections_created`` and ``requests``. urllib3 never makes a request
+    wait for a connection: above ``max_connections`` it opens one that is
+    closed after use, so an undersized pool shows up as ``connections_created``
+    growing with ``requests``. Calls that wait do so on the executor
+    (``executor_waiters``) or on the rate limiters (``limiter_waiters``).
+    """
+    pools = []
+    for region, runtime in _registry.runtime_clients().items():
+        for read_timeout, client in getattr(runtime, "clients", {}).items():
+            for pool in _connection_pools(client):
+                queue = pool.pool
+                size = queue.maxsize if queue is not None else 0
+                pools.append({
+                    "region": region,
+                    "read_timeout": read_timeout,
+                    "host": pool.host,
+                    "max_connections": size,
+                    # The queue starts out full of placeholders; a checked-out connection leaves a gap
+                    "checked_out": size - queue.qsize() if queue is not None else 0,
+                    "idle": sum(conn is not None for conn in list(queue.queue)) if queue is not None else 0,
+                    "connections_created": pool.num_connections,
+                    "requests": pool.num_requests,
+                })
+    with _rate_limiters_lock:
+        limiters = list(_rate_limiters.values())
+    return {
+        "pools": pools,
+        "executor_waiters": _executor._work_queue.qsize() if _executor is not None else 0,
+        "limiter_waiters": sum(limiter.waiting for limiter in limiters),
+    }
+
+
+def collect_client_metrics(metrics) -> None:
+    """Copy :func:`pool_stats` into a ``utils.tracing.Metrics`` registry."""
+    stats = pool_stats()
+    for pool in stats["pools"]:
+        labels = {"region": pool["region"], "read_timeout": f"{pool['read_timeout']:g}", "host": pool["host"]}
+        metrics.set("bedrock_pool_max_connections", "Connection pool size", pool["max_connections"], **labels)
+        metrics.set("bedrock_pool_checked_out_connections", "Connections in use", pool["checked_out"], **labels)
+        metrics.set("bedrock_pool_idle_connections", "Open connections waiting for reuse", pool["idle"], **labels)
+        metrics.set("bedrock_pool_connections_created_total", "New connections opened", pool["connections_created"], "counter", **labels)
+        metrics.set("bedrock_pool_requests_total", "Requests sent through the pool", pool["requests"], "counter", **labels)
+    metrics.set("llm_executor_waiters", "Async calls queued for an executor thread", stats["executor_waiters"])
+    metrics.set("llm_limiter_waiters", "Calls waiting for the rate limiter", stats["limiter_waiters"])
+    if _single_flight is not None:
+        flights = _single_flight.stats()
+        metrics.set("llm_single_flight_requests_total", "Model calls made through the single-flight layer", flights["requests"], "counter")
+        metrics.set("llm_single_flight_coalesced_total", "Calls that shared an identical call in flight", flights["coalesced"], "counter")
+        metrics.set("llm_single_flight_coalescing_ratio", "Share of calls that were coalesced", flights["coalescing_ratio"])
+    if _hedger is not None:
+        for node, hedging in _hedger.stats().items():
+            metrics.set("llm_hedge_calls_total", "Calls from nodes with hedging on", hedging["calls"], "counter", node=node)
+            metrics.set("llm_hedges_total", "Duplicate requests sent for slow calls", hedging["hedged"], "counter", node=node)
+            metrics.set("llm_hedge_wins_total", "Hedges that answered before the original request", hedging["hedge_wins"], "counter", node=node)
+            metrics.set("llm_hedge_rate", "Share of calls that were hedged", hedging["hedge_rate"], node=node)
+            metrics.set("llm_hedge_win_rate", "Share of hedges that answered first", hedging["win_rate"], node=node)
+            if hedging["delay"] is not None:
+                metrics.set("llm_hedge_delay_seconds", "Latency after which a call is hedged", hedging["delay"], node=node)
+    if _semantic_cache is not None:
+        semantic = _semantic_cache.stats()
+        metrics.set("llm_semantic_cache_hits_total", "Calls answered from a similar earlier prompt", semantic["hits"], "counter")
+        metrics.set("llm_semantic_cache_misses_total", "Semantic cache lookups without a similar prompt", semantic["misses"], "counter")
+        metrics.set("llm_semantic_cache_entries", "Responses in the semantic cache index", semantic["entries"])
+        metrics.set("llm_semantic_cache_audited_total", "Semantic cache hits re-checked against the model", semantic["audited"], "counter")
+        metrics.set("llm_semantic_cache_false_hits_total", "Re-checked hits whose fresh answer differed", semantic["false_hits"], "counter")
+
+
+def _reinit_after_fork():
+    global _executor, _executor_lock, _response_cache, _response_cache_lock
+    global _semantic_cache, _semantic_cache_lock, _rate_limiters, _rate_limiters_lock
+    global _single_flight, _single_flight_lock, _hedger, _hedger_lock
+    # The parent's pool threads do not exist in the child, and neither its
+    # SQLite connections nor its botocore sockets may be shared with it.
+    _executor, _executor_lock = None, threading.Lock()
+    _response_cache, _response_cache_lock = None, threading.Lock()
+    _semantic_cache, _semantic_cache_lock = None, threading.Lock()
+    _rate_limiters, _rate_limiters_lock = {}, threading.Lock()
+    # Calls in flight in the parent never finish in the child
+    _single_flight, _single_flight_lock = None, threading.Lock()
+    _hedger, _hedger_lock = None, threading.Lock()
+    _registry._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+class ChatClientFactory:
     @abstractmethod
     def create_client(self):
         pass
 
 
 class Claude3_7SonnetFactory(ChatClientFactory):
-    _client = None
-    _thinking_client = None
-
-    def create_client(self, thinking=False, max_output_tokens=8192):
-        if not thinking:
-            if self._client is None:
-                self._client = ChatBedrock(
-                    model_id=settings.CLAUDE_3_7_SONNET_MODEL_ID,
-                    region_name=settings.AWS_REGION,
-                    config=config,
-                    model_kwargs=dict(
-                        max_tokens=max_output_tokens,
-                    ),
-                )
-            return self._client
\ No newline at end of file
+    def create_client(self, thinking=False, max_output_tokens=8192, temperature=None):
+        return get_client_registry().get(
+            settings.CLAUDE_3_7_SONNET_MODEL_ID,
+            thinking=thinking,
+            max_tokens=max_output_tokens,
+            temperature=temperature,
+        )
@@ -0,0 +1,191 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _features(text: str) -> List[str]:
+    words = _WORD.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesRouter:
+    """Multinomial naive Bayes over word unigrams and bigrams.
+
+    Meant to sit in front of an LLM router: it is trained from logged
+    ``(input, decision)`` pairs, answers in microseconds, and reports a
+    posterior probability so callers only trust it above a threshold.
+    Inputs with fewer than ``min_known_features`` features seen in training
+    get no prediction: their posterior would just be the class prior.
+    """
+
+    def __init__(self, alpha: float = 1.0, min_known_features: int = 1):
+        self.alpha = alpha
+        self.min_known_features = min_known_features
+        self.label_counts: Counter = Counter()
+        self.feature_counts: Dict[str, Counter] = defaultdict(Counter)
+        # Sum of feature_counts[label], kept up to date by fit
+        self.feature_totals: Counter = Counter()
+        self.vocabulary: set = set()
+
+    def fit(self, examples: Iterable[Tuple[str, str]]) -> "NaiveBayesRouter":
+        """Add ``(text, label)`` examples to the model."""
+        for text, label in examples:
+            features = _features(text)
+            self.label_counts[label] += 1
+            self.feature_counts[label].update(features)
+            self.feature_totals[label] += len(features)
+            self.vocabulary.update(features)
+        return self
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """Most likely label for ``text`` and its posterior probability."""
+        if not self.label_counts:
+            return None, 0.0
+        features = [f for f in _features(text) if f in self.vocabulary]
+        if len(features) < max(1, self.min_known_features):
+            return None, 0.0
+        total = sum(self.label_counts.values())
+        smoothing = self.alpha * len(self.vocabulary)
+
+        scores = {}
+        for label, count in self.label_counts.items():
+            counts = self.feature_counts[label]
+            denominator = self.feature_totals[label] + smoothing
+            scores[label] = math.log(count / total) + sum(
+                math.log((counts[f] + self.alpha) / denominator) for f in features
+            )
+
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    @classmethod
+    def from_jsonl(cls, path: str, text_key: str = "input", label_key: str = "decision", **kwargs: Any) -> "NaiveBayesRouter":
+        """Train on a decision log written by :class:`DecisionLog`."""
+        with open(path) as file:
+            records = [json.loads(line) for line in file if line.strip()]
+        return cls(**kwargs).fit(
+            (record[text_key], record[label_key]) for record in records if record.get(label_key)
+        )
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "alpha": self.alpha,
+                    "min_known_features": self.min_known_features,
+                    "label_counts": self.label_counts,
+                    "feature_counts": self.feature_counts,
+                },
+                file,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "NaiveBayesRouter":
+        with open(path) as file:
+            data = json.load(file)
+        router = cls(alpha=data["alpha"], min_known_features=data.get("min_known_features", 1))
+        router.label_counts = Counter(data["label_counts"])
+        for label, counts in data["feature_counts"].items():
+            router.feature_counts[label] = Counter(counts)
+            router.feature_totals[label] = sum(router.feature_counts[label].values())
+            router.vocabulary.update(counts)
+        return router
+
+
+class DecisionLog:
+    """Append-only JSONL log of LLM routing decisions, i.e. training data."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def append(self, text: str, decision: str) -> None:
+        line = json.dumps({"input": text, "decision": decision}) + "\n"
+        with self._lock, open(self.path, "a") as file:
+            file.write(line)
+
+
+class RouterMetrics:
+    """Counters for a local router placed in front of an LLM router.
+
+    Accuracy is measured against the LLM on every fallback (where the local
+    guess was not confident) and on shadow samples of confident decisions;
+    ``confident_accuracy`` only uses the latter, so it estimates the error
+    rate of the decisions that actually skipped the LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def record_local(self) -> None:
+        self._count("local")
+
+    def record_fallback(self) -> None:
+        self._count("fallback")
+
+    def record_comparison(self, predicted: Optional[str], decision: str, confident: bool) -> None:
+        prefix = "confident" if confident else "fallback"
+        self._count(f"{prefix}_compared")
+        if predicted == decision:
+            self._count(f"{prefix}_agreed")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        get = lambda name: counters.get(name, 0)
+        routed = get("local") + get("fallback")
+        compared = get("confident_compared") + get("fallback_compared")
+        agreed = get("confident_agreed") + get("fallback_agreed")
+        return {
+            "routed": routed,
+            "local": get("local"),
+            "fallback": get("fallback"),
+            "fallback_rate": get("fallback") / routed if routed else 0.0,
+            "accuracy": agreed / compared if compared else None,
+            "confident_accuracy": (
+                get("confident_agreed") / get("confident_compared") if get("confident_compared") else None
+            ),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(prog="python -m utils.local_router", description="Train a local router from a decision log.")
+    parser.add_argument("log", help="JSONL decision log ({'input': ..., 'decision': ...} per line)")
+    parser.add_argument("model", help="where to write the trained model")
+    parser.add_argument("--threshold", type=float, default=0.9, help="confidence threshold to evaluate")
+    args = parser.parse_args()
+
+    with open(args.log) as file:
+        examples = [(r["input"], r["decision"]) for r in map(json.loads, filter(str.strip, file)) if r.get("decision")]
+    random.Random(0).shuffle(examples)
+    held_out, training = examples[: len(examples) // 5], examples[len(examples) // 5:]
+
+    confident = correct = 0
+    evaluation = NaiveBayesRouter().fit(training)
+    for text, label in held_out:
+        predicted, confidence = evaluation.predict(text)
+        if confidence >= args.threshold:
+            confident += 1
+            correct += predicted == label
+    if held_out:
+        print(f"held out: {len(held_out)}, confident: {confident / len(held_out):.1%}, "
+              f"accuracy when confident: {correct / confident if confident else 0:.1%}")
+
+    NaiveBayesRouter().fit(examples).save(args.model)
+    print(f"trained on {len(examples)} decisions -> {args.model}")
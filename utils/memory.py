@@ -0,0 +1,162 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional
+
+from utils.tokens import estimate_tokens
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be", "to", "of", "in", "on",
+    "for", "with", "at", "by", "it", "this", "that", "i", "you", "me", "do", "does", "did", "so",
+}
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def extractive_summary(summary: str, turn: Dict[str, str]) -> str:
+    """Default summarizer: append the first sentence of the evicted turn."""
+    first_sentence = re.split(r"(?<=[.!?])\s", turn["content"].strip(), maxsplit=1)[0]
+    line = f"{turn['role']}: {first_sentence}"
+    return f"{summary}\n{line}" if summary else line
+
+
+class ConversationMemory:
+    """Conversation memory that sends a bounded, relevant slice of the history.
+
+    The last ``recent_turns`` turns are always included. Older turns are
+    indexed with BM25 and the ``top_k`` most relevant to the current input
+    are pulled back in, after a rolling summary of everything that left the
+    recent window. The whole context is kept under ``token_budget``, so prompt
+    size stays flat however long the session gets.
+
+    Every turn is rendered and indexed once, when it is added, and the stable
+    part of the context (summary plus recent turns) is cached until the next
+    message arrives.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 1500,
+        recent_turns: int = 4,
+        top_k: int = 4,
+        summary_budget: int = 300,
+        summarizer: Callable[[str, Dict[str, str]], str] = extractive_summary,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.top_k = top_k
+        self.summary_budget = summary_budget
+        self.summarizer = summarizer
+        self.k1 = k1
+        self.b = b
+
+        self.history: List[Dict[str, str]] = []
+        self._lines: List[str] = []
+        self._tokens: List[int] = []
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self.summary = ""
+        self._summarized = 0
+        self._prefix: Optional[str] = None
+
+    def add_message(self, role: str, content: str):
+        turn = len(self.history)
+        self.history.append({"role": role, "content": content})
+        self._lines.append(f"{role}: {content}")
+        self._tokens.append(estimate_tokens(self._lines[-1]))
+
+        terms = _terms(content)
+        for term, count in Counter(terms).items():
+            self._postings[term][turn] = count
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+
+        # Fold turns that just left the recent window into the summary
+        while self._summarized < len(self.history) - self.recent_turns:
+            self.summary = self._trim_summary(self.summarizer(self.summary, self.history[self._summarized]))
+            self._summarized += 1
+        self._prefix = None
+
+    def _trim_summary(self, summary: str) -> str:
+        lines = summary.splitlines()
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def get_conversation_history(self) -> str:
+        """The full, unbounded history (what earlier versions sent every turn)."""
+        return "\n".join(self._lines)
+
+    def search(self, query: str, k: Optional[int] = None) -> List[int]:
+        """Indices of the older turns (outside the recent window) most relevant to ``query``."""
+        candidates = len(self.history) - self.recent_turns
+        if candidates <= 0:
+            return []
+        average_length = self._total_length / len(self.history) or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(_terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.history) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for turn, count in postings.items():
+                if turn < candidates:
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[turn] / average_length)
+                    scores[turn] += idf * count * (self.k1 + 1) / (count + norm)
+        return sorted(scores, key=scores.get, reverse=True)[: self.top_k if k is None else k]
+
+    def _recent(self) -> List[int]:
+        return list(range(max(0, len(self.history) - self.recent_turns), len(self.history)))
+
+    def _stable_prefix(self) -> str:
+        if self._prefix is None:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+            recent = self._recent()
+            if recent:
+                parts.append("Most recent messages:\n" + "\n".join(self._lines[i] for i in recent))
+            self._prefix = "\n\n".join(parts)
+        return self._prefix
+
+    def get_context(self, query: str) -> str:
+        """Summary, recent turns and the older turns relevant to ``query``, within the token budget."""
+        budget = self.token_budget - estimate_tokens(self.summary)
+        recent = self._recent()
+        # The newest turns win if even the recent window does not fit
+        while recent and sum(self._tokens[i] for i in recent) > budget:
+            recent.pop(0)
+        if len(recent) < min(self.recent_turns, len(self.history)):
+            parts = [f"Summary of the earlier conversation:\n{self.summary}"] if self.summary else []
+            parts.append("Most recent messages:\n" + "\n".join(self._lines[i] for i in recent))
+            return "\n\n".join(parts)
+        budget -= sum(self._tokens[i] for i in recent)
+
+        relevant = []
+        for turn in self.search(query):
+            if self._tokens[turn] <= budget:
+                relevant.append(turn)
+                budget -= self._tokens[turn]
+        context = self._stable_prefix()
+        if relevant:
+            context += "\n\nRelevant earlier messages:\n" + "\n".join(self._lines[i] for i in sorted(relevant))
+        return context
+
+
+# Function to format conversation with memory
+def format_with_memory(user_input: str, memory: ConversationMemory) -> str:
+    context = memory.get_context(user_input)
+    if context:
+        return f"""Previous conversation:
+{context}
+
+Current user input: {user_input}
+
+Please respond to the current input while considering the conversation history."""
+    return user_input
@@ -0,0 +1,95 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+# Bedrock ignores a cache checkpoint whose prefix is shorter than this
+# (1024 tokens for Claude 3.7 Sonnet), so short prompts are simply not cached.
+MIN_CACHEABLE_TOKENS = 1024
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Response headers through which InvokeModel reports prompt-cache usage
+CACHE_READ_HEADER = "x-amzn-bedrock-cache-read-input-token-count"
+CACHE_WRITE_HEADER = "x-amzn-bedrock-cache-write-input-token-count"
+
+
+def cacheable_content(prefix: str, history: Sequence[str] = (), suffix: str = "") -> List[Dict[str, Any]]:
+    """Message content with prompt-cache checkpoints after ``prefix`` and ``history``.
+
+    ``prefix`` is the static part of a prompt (instructions), ``history`` the
+    part that only ever grows (one block per conversation message) and
+    ``suffix`` whatever changes on every call. Bedrock caches the request up
+    to each checkpoint; on the next turn the prefix hits directly and the
+    history hits up to the previous turn's last message, because a cache
+    lookup also checks the block boundaries before a checkpoint.
+    """
+    blocks = [{"type": "text", "text": prefix, "cache_control": CACHE_CONTROL}]
+    blocks.extend({"type": "text", "text": text} for text in history if text.strip())
+    if len(blocks) > 1:
+        blocks[-1]["cache_control"] = CACHE_CONTROL
+    if suffix.strip():
+        blocks.append({"type": "text", "text": suffix})
+    return blocks
+
+
+_last_usage = threading.local()
+
+
+def record_response_headers(parsed: Dict[str, Any], **kwargs: Any) -> None:
+    """botocore ``after-call`` handler that keeps the call's prompt-cache usage.
+
+    The usage is stored per thread, which is the thread that made the call,
+    until :func:`take_cache_usage` collects it.
+    """
+    headers = parsed.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    if CACHE_READ_HEADER in headers or CACHE_WRITE_HEADER in headers:
+        _last_usage.value = {
+            "cache_read": int(headers.get(CACHE_READ_HEADER, 0)),
+            "cache_creation": int(headers.get(CACHE_WRITE_HEADER, 0)),
+        }
+    else:
+        _last_usage.value = None
+
+
+def register_response_hooks(client: Any) -> None:
+    """Record prompt-cache usage for every model call made through ``client``."""
+    for operation in ("InvokeModel", "InvokeModelWithResponseStream"):
+        client.meta.events.register(f"after-call.bedrock-runtime.{operation}", record_response_headers)
+
+
+def take_cache_usage() -> Optional[Dict[str, int]]:
+    """Prompt-cache usage of the last call made by this thread, if Bedrock reported any."""
+    usage = getattr(_last_usage, "value", None)
+    _last_usage.value = None
+    return usage
+
+
+class PromptCacheStats:
+    """Prompt-cache token counters, in total and per graph node."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "input_tokens": 0, "cache_read": 0, "cache_creation": 0}
+        )
+
+    def record(self, input_tokens: int, usage: Dict[str, int], node: Optional[str] = None) -> None:
+        with self._lock:
+            for key in ("total", node or "unknown"):
+                counters = self._counters[key]
+                counters["calls"] += 1
+                counters["input_tokens"] += input_tokens
+                counters["cache_read"] += usage["cache_read"]
+                counters["cache_creation"] += usage["cache_creation"]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Counters per node (and under ``"total"``), with the share of input read from cache."""
+        with self._lock:
+            stats = {key: dict(counters) for key, counters in self._counters.items()}
+        for counters in stats.values():
+            prompt_tokens = counters["input_tokens"] + counters["cache_read"] + counters["cache_creation"]
+            counters["cache_read_ratio"] = counters["cache_read"] / prompt_tokens if prompt_tokens else 0.0
+        return stats
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,305 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows: state is still shared between threads
+    fcntl = None
+
+T = TypeVar("T")
+
+# Error codes Bedrock uses to say "slow down" rather than "this request is bad"
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+# Failures of a single request (server errors, dropped connections) that are worth
+# another try. botocore's own retries are off, so the limiter retries these too.
+TRANSIENT_ERROR_CODES = {"InternalServerException", "InternalFailure", "ServiceException"}
+TRANSIENT_ERROR_TYPES = {"EndpointConnectionError", "ConnectionClosedError", "ConnectTimeoutError"}
+
+
+def _chain(error: Optional[BaseException]) -> Iterator[BaseException]:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether ``error`` (or anything it was raised from) is a server error or a dropped connection.
+
+    Read timeouts are not: they are the call's deadline.
+    """
+    for error in _chain(error):
+        if any(cls.__name__ in TRANSIENT_ERROR_TYPES for cls in type(error).__mro__):
+            return True
+        response = getattr(error, "response", None)
+        if isinstance(response, dict):
+            if response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES:
+                return True
+            if response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500:
+                return True
+    return False
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """Whether ``error`` (or anything it was raised from) is a Bedrock throttle."""
+    for error in _chain(error):
+        response = getattr(error, "response", None)
+        if isinstance(response, dict):
+            if response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+                return True
+        if any(code in str(error) for code in THROTTLING_ERROR_CODES):
+            return True
+    return False
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedStateStore:
+    """JSON state file guarded by a thread lock plus an ``flock`` across processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def _open(self):
+        # A file description inherited over fork shares its flock with the
+        # parent, so every process needs its own.
+        if self._file is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "a+")
+            self._pid = os.getpid()
+        return self._file
+
+    @contextmanager
+    def transaction(self) -> Iterator[Dict[str, Any]]:
+        """Yield the current state; changes made to it are written back on exit."""
+        with self._lock:
+            file = self._open()
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                raw = file.read()
+                try:
+                    state = json.loads(raw) if raw else {}
+                except ValueError:
+                    state = {}
+                yield state
+                file.seek(0)
+                file.truncate()
+                file.write(json.dumps(state))
+                file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class AdaptiveRateLimiter:
+    """Token buckets plus an AIMD concurrency limit for one model id.
+
+    Requests and tokens per minute are enforced with token buckets, and the
+    number of calls in flight is capped by a limit that grows by one per
+    ``limit`` successful calls and halves on every throttling error (AIMD, as
+    in TCP congestion control). A throttle also sets a shared, jittered
+    backoff deadline so every worker pauses together instead of retrying in
+    waves. All of this lives in a :class:`SharedStateStore`, so threads and
+    local processes share one view of the model's capacity.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        store: SharedStateStore,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 50,
+        min_concurrency: int = 1,
+        max_retries: int = 6,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        poll_interval: float = 0.05,
+    ):
+        self.model_id = model_id
+        self.store = store
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        # Threads of this process blocked in acquire()
+        self.waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def _model_state(self, state: Dict[str, Any], now: float) -> Dict[str, Any]:
+        entry = state.setdefault(self.model_id, {})
+        entry.setdefault("requests", self.requests_per_minute or 0.0)
+        entry.setdefault("tokens", self.tokens_per_minute or 0.0)
+        entry.setdefault("refilled_at", now)
+        entry.setdefault("limit", float(self.max_concurrency))
+        entry.setdefault("inflight", {})
+        entry.setdefault("backoff_until", 0.0)
+        entry.setdefault("throttle_streak", 0)
+
+        elapsed = max(0.0, now - entry["refilled_at"])
+        if self.requests_per_minute:
+            entry["requests"] = min(
+                self.requests_per_minute,
+                entry["requests"] + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            entry["tokens"] = min(
+                self.tokens_per_minute,
+                entry["tokens"] + elapsed * self.tokens_per_minute / 60,
+            )
+        entry["refilled_at"] = now
+        entry["inflight"] = {
+            pid: count
+            for pid, count in entry["inflight"].items()
+            if count > 0 and _pid_alive(int(pid))
+        }
+        return entry
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot if one is free; otherwise return how long to wait."""
+        now = time.time()
+        with self.store.transaction() as state:
+            entry = self._model_state(state, now)
+            if now < entry["backoff_until"]:
+                return entry["backoff_until"] - now
+            if sum(entry["inflight"].values()) >= int(entry["limit"]):
+                return self.poll_interval
+            if self.requests_per_minute and entry["requests"] < 1:
+                return (1 - entry["requests"]) * 60 / self.requests_per_minute
+            if self.tokens_per_minute:
+                # Requests larger than the whole bucket go through once it is full
+                needed = min(tokens, self.tokens_per_minute)
+                if entry["tokens"] < needed:
+                    return (needed - entry["tokens"]) * 60 / self.tokens_per_minute
+
+            if self.requests_per_minute:
+                entry["requests"] -= 1
+            if self.tokens_per_minute:
+                entry["tokens"] -= tokens
+            pid = str(os.getpid())
+            entry["inflight"][pid] = entry["inflight"].get(pid, 0) + 1
+            return 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a request of ``tokens`` may be sent; return seconds waited."""
+        started = time.monotonic()
+        wait = self._try_acquire(tokens)
+        if wait <= 0:
+            return 0.0
+        with self._waiting_lock:
+            self.waiting += 1
+        try:
+            while wait > 0:
+                time.sleep(min(wait, self.max_backoff) * random.uniform(1.0, 1.2))
+                wait = self._try_acquire(tokens)
+        finally:
+            with self._waiting_lock:
+                self.waiting -= 1
+        return time.monotonic() - started
+
+    def release(
+        self, reserved_tokens: int = 0, used_tokens: Optional[int] = None, throttled: bool = False, failed: bool = False
+    ) -> None:
+        """Return the in-flight slot and feed the outcome back into the limits.
+
+        A ``failed`` (transient, see :func:`is_transient_error`) request says
+        nothing about capacity: its tokens are refunded and the limit is kept.
+        """
+        now = time.time()
+        with self.store.transaction() as state:
+            entry = self._model_state(state, now)
+            pid = str(os.getpid())
+            entry["inflight"][pid] = max(0, entry["inflight"].get(pid, 0) - 1)
+            if throttled:
+                # Refund what was reserved: a throttled request consumed nothing
+                if self.tokens_per_minute:
+                    entry["tokens"] += reserved_tokens
+                entry["limit"] = max(self.min_concurrency, entry["limit"] / 2)
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** entry["throttle_streak"])
+                entry["backoff_until"] = max(entry["backoff_until"], now + random.uniform(backoff / 2, backoff))
+                entry["throttle_streak"] += 1
+            elif failed:
+                if self.tokens_per_minute:
+                    entry["tokens"] += reserved_tokens
+            else:
+                if self.tokens_per_minute and used_tokens is not None:
+                    entry["tokens"] += reserved_tokens - used_tokens
+                entry["limit"] = min(self.max_concurrency, entry["limit"] + 1 / entry["limit"])
+                entry["throttle_streak"] = 0
+
+    def call(
+        self,
+        func: Callable[[], T],
+        tokens: int = 0,
+        used_tokens: Callable[[T], Optional[int]] = lambda result: None,
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> T:
+        """Run ``func`` under the limiter, retrying it when Bedrock throttles or fails transiently.
+
+        ``stats``, if given, receives the total ``queue_wait`` (seconds) and
+        the number of ``retries``.
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = self.acquire(tokens)
+            if stats is not None:
+                stats["queue_wait"] = stats.get("queue_wait", 0.0) + waited
+                stats["retries"] = attempt
+            try:
+                result = func()
+            except Exception as error:
+                throttled = is_throttling_error(error)
+                transient = not throttled and is_transient_error(error)
+                self.release(tokens, throttled=throttled, failed=transient)
+                if (throttled or transient) and attempt < self.max_retries:
+                    if transient:
+                        self.pause(attempt)
+                    continue
+                raise
+            self.release(tokens, used_tokens(result))
+            return result
+
+    def pause(self, attempt: int) -> None:
+        """Jittered exponential backoff of this caller only, before retrying a transient failure."""
+        time.sleep(random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Current shared limiter state for this model id."""
+        with self.store.transaction() as state:
+            entry = self._model_state(state, time.time())
+            return {
+                "concurrency_limit": entry["limit"],
+                "in_flight": sum(entry["inflight"].values()),
+                "requests_available": entry["requests"] if self.requests_per_minute else None,
+                "tokens_available": entry["tokens"] if self.tokens_per_minute else None,
+                "backoff_remaining": max(0.0, entry["backoff_until"] - time.time()),
+            }
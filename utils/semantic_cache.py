@@ -0,0 +1,267 @@
+import copy
+import hashlib
+import json
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Collection, Dict, FrozenSet, List, Optional, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.runnables.config import var_child_runnable_config
+
+_WORD = re.compile(r"[a-z0-9']+")
+_PRIME = (1 << 61) - 1
+
+
+def _stem(word: str) -> str:
+    # Plurals are the most common wording difference ("engineers" vs "engineer")
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def features(text: str) -> FrozenSet[str]:
+    """Normalized words and word pairs of ``text``: the set two prompts are compared on."""
+    words = [_stem(word) for word in _WORD.findall(text.lower())]
+    return frozenset(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _hash64(value: str) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+class MinHash:
+    """MinHash signatures with locality-sensitive hashing bands.
+
+    Two feature sets share a band with a probability that grows steeply with
+    their Jaccard similarity, around ``(1 / bands) ** (1 / rows)`` (0.71 for
+    the default 16 bands of 8 rows), so an index only has to compare a prompt
+    with the few entries that share one of its bands.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        rng = random.Random(seed)
+        self.rows = num_perm // bands
+        self.bands = bands
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, items: Collection[str]) -> List[int]:
+        hashes = [_hash64(item) for item in items]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms]
+
+    def band_keys(self, signature: List[int]) -> List[Tuple[int, int]]:
+        return [(band, hash(tuple(signature[band * self.rows:(band + 1) * self.rows]))) for band in range(self.bands)]
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    # Content blocks (e.g. with prompt-cache checkpoints): only the text counts
+    return "\n".join(block.get("text", "") for block in content or [] if isinstance(block, dict))
+
+
+def split_prompt(prompt: str) -> Tuple[str, str]:
+    """``(context, query)`` of a prompt serialized by LangChain.
+
+    The query is the text of the last message and is matched approximately;
+    every message before it (system prompt, history) has to match exactly.
+    """
+    messages = json.loads(prompt)
+    if not messages:
+        return "", ""
+    *context, last = messages
+    return json.dumps(context, sort_keys=True), _text(last.get("kwargs", {}).get("content"))
+
+
+def _current_node() -> Optional[str]:
+    # Cache lookups get no run manager; the graph node's config is in the context
+    return ((var_child_runnable_config.get() or {}).get("metadata") or {}).get("langgraph_node")
+
+
+def _answer(return_val: RETURN_VAL_TYPE) -> Any:
+    message = getattr(return_val[0], "message", None) if return_val else None
+    if message is not None and getattr(message, "tool_calls", None):
+        return [(call["name"], call["args"]) for call in message.tool_calls]
+    return " ".join(return_val[0].text.split()) if return_val else None
+
+
+class _Entry:
+    __slots__ = ("context", "query", "features", "bands", "value")
+
+    def __init__(self, context, query, features, bands, value):
+        self.context = context
+        self.query = query
+        self.features = features
+        self.bands = bands
+        self.value = value
+
+
+class SemanticCache(BaseCache):
+    """In-memory cache that also answers prompts worded almost like an earlier one.
+
+    Only calls made from a graph node in ``nodes`` are matched approximately:
+    list the nodes whose answer is safe to share between near-duplicate
+    inputs ("Software Engineers" vs "software engineer"), such as a router.
+    Everything else, and any exact match, goes to ``exact`` (the on-disk
+    response cache) when one is given.
+
+    A call matches an earlier one with the same ``llm_string`` (model, kwargs,
+    output schema) and the same messages except the last, whose text must
+    have a Jaccard similarity of at least ``threshold`` over normalized words
+    and word pairs. Candidates come from a MinHash LSH index holding the
+    ``max_entries`` most recently used responses; the similarity is then
+    computed exactly.
+
+    An ``audit_rate`` fraction of approximate hits is sent to the model
+    anyway and the two answers compared. Tool calls and structured output
+    must match exactly and text after whitespace normalization, so for
+    free-text nodes a disagreement may just be sampling variation: the
+    pairs are appended to ``audit_path`` for review.
+    """
+
+    def __init__(
+        self,
+        nodes: Collection[str],
+        threshold: float = 0.9,
+        max_entries: int = 10_000,
+        exact: Optional[BaseCache] = None,
+        audit_rate: float = 0.0,
+        audit_path: Optional[str] = None,
+        minhash: Optional[MinHash] = None,
+    ):
+        self.nodes = frozenset(nodes)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.exact = exact
+        self.audit_rate = audit_rate
+        self.audit_path = audit_path
+        self.minhash = minhash or MinHash()
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, int], set] = {}
+        # Audited hits waiting for the model's answer
+        self._audits: "OrderedDict[Tuple[str, str], Tuple[_Entry, float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._counters = {"hits": 0, "misses": 0, "evicted": 0, "audited": 0, "false_hits": 0}
+
+    def _key(self, prompt: str, llm_string: str) -> Tuple[str, str, FrozenSet[str]]:
+        context, query = split_prompt(prompt)
+        return f"{llm_string}\x00{context}", query, features(query)
+
+    def _match(self, context: str, query_features: FrozenSet[str]) -> Tuple[Optional[_Entry], float]:
+        # Called with the lock held
+        best, similarity = None, 0.0
+        signature = self.minhash.signature(query_features)
+        candidates = set()
+        for band in self.minhash.band_keys(signature):
+            candidates |= self._buckets.get((context, *band), set())
+        for key in candidates:
+            entry = self._entries[key]
+            score = jaccard(query_features, entry.features)
+            if score > similarity:
+                best, similarity = entry, score
+        return (best, similarity) if similarity >= self.threshold else (None, similarity)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.exact is not None:
+            cached = self.exact.lookup(prompt, llm_string)
+            if cached is not None:
+                return cached
+        node = _current_node()
+        if node not in self.nodes:
+            return None
+        context, query, query_features = self._key(prompt, llm_string)
+        if not query_features:
+            return None
+        with self._lock:
+            entry, similarity = self._match(context, query_features)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end((entry.context, entry.query))
+            if self.audit_rate and self._random.random() < self.audit_rate:
+                self._audits[(prompt, llm_string)] = (entry, similarity, node)
+                while len(self._audits) > 1024:
+                    self._audits.popitem(last=False)
+                return None
+            self._counters["hits"] += 1
+            value = entry.value
+        # Callers may annotate the messages they get back
+        return copy.deepcopy(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.exact is not None:
+            self.exact.update(prompt, llm_string, return_val)
+        if _current_node() not in self.nodes:
+            return
+        context, query, query_features = self._key(prompt, llm_string)
+        if not query_features:
+            return
+        bands = [(context, *band) for band in self.minhash.band_keys(self.minhash.signature(query_features))]
+        with self._lock:
+            audit = self._audits.pop((prompt, llm_string), None)
+            self._remove((context, query))
+            entry = self._entries[(context, query)] = _Entry(context, query, query_features, bands, copy.deepcopy(return_val))
+            for band in bands:
+                self._buckets.setdefault(band, set()).add((context, query))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counters["evicted"] += 1
+            if audit is not None:
+                self._counters["audited"] += 1
+                agree = _answer(audit[0].value) == _answer(entry.value)
+                self._counters["false_hits"] += not agree
+        if audit is not None and self.audit_path:
+            self._write_audit(audit, entry, agree)
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        # Called with the lock held
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _write_audit(self, audit: Tuple[_Entry, float, str], fresh: _Entry, agree: bool) -> None:
+        cached, similarity, node = audit
+        record = {
+            "node": node,
+            "similarity": round(similarity, 3),
+            "query": fresh.query,
+            "matched_query": cached.query,
+            "cached_answer": _answer(cached.value),
+            "fresh_answer": _answer(fresh.value),
+            "agree": agree,
+        }
+        with self._lock, open(self.audit_path, "a") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._audits.clear()
+        if self.exact is not None:
+            self.exact.clear(**kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Approximate-match counters for this process: hit rate, evictions and audited false hits."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["false_hit_rate"] = stats["false_hits"] / stats["audited"] if stats["audited"] else 0.0
+        return stats
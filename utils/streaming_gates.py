@@ -0,0 +1,117 @@
+import time
+from typing import Any, Callable, Collection, Dict, Iterable, Optional, Tuple
+
+Settle = Callable[[str], Optional[str]]
+
+
+class StreamingGate:
+    """A gate on a node's output that can be decided while the output streams in.
+
+    ``settle(text)`` is called with the text generated so far after every
+    chunk and returns an outcome as soon as no further text can change it
+    (``None`` until then). ``finish(text)`` decides on the complete text
+    when ``settle`` never did. So ``evaluate`` gives the same outcome on a
+    finished text, and the gate can still be used as a conditional edge.
+
+    Once the gate settles, ``on_settled(outcome, text)`` is called on the
+    streaming thread, e.g. to start the next step on the partial text.
+    Outcomes in ``stop_on`` also end the generation there, which saves the
+    remaining output tokens when the rest of the text is not needed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        settle: Settle,
+        finish: Callable[[str], str],
+        stop_on: Collection[str] = (),
+        on_settled: Optional[Callable[[str, str], Any]] = None,
+    ):
+        self.name = name
+        self.settle = settle
+        self.finish = finish
+        self.stop_on = frozenset(stop_on)
+        self.on_settled = on_settled
+
+    def evaluate(self, text: str) -> str:
+        """Outcome for a complete ``text``."""
+        return self.settle(text) or self.finish(text)
+
+
+def contains_any(name: str, needles: Iterable[str], found: str, missing: str, **kwargs: Any) -> StreamingGate:
+    """Gate that settles on ``found`` at the first of ``needles``, else ``missing`` at the end."""
+    needles = tuple(needles)
+    return StreamingGate(
+        name,
+        settle=lambda text: found if any(needle in text for needle in needles) else None,
+        finish=lambda text: missing,
+        **kwargs,
+    )
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict) and block.get("type") == "text")
+
+
+def gated_stream(
+    runnable: Any,
+    input: Any,
+    gates: Iterable[StreamingGate],
+    config: Optional[Dict[str, Any]] = None,
+) -> Tuple[Any, Dict[str, Dict[str, Any]]]:
+    """Stream ``runnable`` (a chat model) on ``input``, evaluating ``gates`` on every chunk.
+
+    Returns the message, complete unless a gate stopped it, and one decision
+    per gate: its ``outcome``, whether it was settled ``early`` (before the
+    end of the stream), the ``chars`` generated by then, the ``seconds``
+    since the call started and whether it ``stopped`` the generation.
+    """
+    pending = list(gates)
+    decisions: Dict[str, Dict[str, Any]] = {}
+    started = time.perf_counter()
+    message = None
+    chunks = iter(runnable.stream(input, config))
+    try:
+        for chunk in chunks:
+            message = chunk if message is None else message + chunk
+            if not pending:
+                continue
+            text = _text(message.content)
+            stop = False
+            for gate in list(pending):
+                outcome = gate.settle(text)
+                if outcome is None:
+                    continue
+                pending.remove(gate)
+                stop = stop or outcome in gate.stop_on
+                decisions[gate.name] = {
+                    "outcome": outcome,
+                    "early": True,
+                    "chars": len(text),
+                    "seconds": time.perf_counter() - started,
+                    "stopped": outcome in gate.stop_on,
+                }
+                if gate.on_settled is not None:
+                    gate.on_settled(outcome, text)
+            if stop:
+                break
+    finally:
+        # Closing the stream ends the model call (and frees its rate-limiter slot)
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    text = _text(message.content) if message is not None else ""
+    for gate in pending:
+        outcome = gate.evaluate(text)
+        decisions[gate.name] = {
+            "outcome": outcome,
+            "early": False,
+            "chars": len(text),
+            "seconds": time.perf_counter() - started,
+            "stopped": False,
+        }
+        if gate.on_settled is not None:
+            gate.on_settled(outcome, text)
+    return message, decisions
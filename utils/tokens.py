@@ -0,0 +1,27 @@
+import math
+from typing import Any, Sequence
+
+# Claude tokenizes English prose at roughly four characters per token; this is
+# only used for budgeting, so a cheap local estimate beats a tokenizer call.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for ``text``."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(messages: Sequence[Any]) -> int:
+    """Rough input token count for a list of LangChain messages."""
+    total = 0
+    for message in messages:
+        content = getattr(message, "content", message)
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        else:
+            for block in content:
+                if isinstance(block, str):
+                    total += estimate_tokens(block)
+                elif isinstance(block, dict):
+                    total += estimate_tokens(str(block.get("text", "")))
+    return total
@@ -0,0 +1,374 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import settings
+
+# Seconds; LLM calls range from a cached hit to minutes of streaming
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Minimal Prometheus registry: labelled counters, histograms and sampled values.
+
+    Sampled values are set by collectors, which run on every :meth:`render`
+    (i.e. every scrape) to read state kept elsewhere, like pool occupancy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = defaultdict(lambda: defaultdict(_Histogram))
+        self._samples: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[["Metrics"], None]] = []
+
+    def add_collector(self, collector: Callable[["Metrics"], None]) -> None:
+        self._collectors.append(collector)
+
+    def set(self, name: str, help: str, value: float, metric_type: str = "gauge", **labels: str) -> None:
+        """Set a gauge, or a counter whose running total is kept elsewhere (``metric_type="counter"``)."""
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._types[name] = metric_type
+            self._samples[name][tuple(sorted(labels.items()))] = value
+
+    def inc(self, name: str, help: str, value: float = 1, **labels: str) -> None:
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, name: str, help: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._histograms[name][tuple(sorted(labels.items()))].observe(value)
+
+    @staticmethod
+    def _labels(labels: Labels, extra: str = "") -> str:
+        parts = [f'{key}="{value}"' for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        for collector in self._collectors:
+            collector(self)
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {self._help[name]}", f"# TYPE {name} counter"]
+                lines += [f"{name}{self._labels(labels)} {value}" for labels, value in sorted(series.items())]
+            for name, series in sorted(self._samples.items()):
+                lines += [f"# HELP {name} {self._help[name]}", f"# TYPE {name} {self._types[name]}"]
+                lines += [f"{name}{self._labels(labels)} {value}" for labels, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {self._help[name]}", f"# TYPE {name} histogram"]
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{name}_bucket{self._labels(labels, le)} {cumulative}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Records a span per graph node and per chat model call.
+
+    Node spans come from LangGraph's node runs (the chain run named after its
+    ``langgraph_node``). Model spans record wall time, time to first token,
+    token usage including prompt-cache reads/writes, and the rate limiter's
+    queue wait and retries (``call_stats`` in the response metadata). A model
+    call served from the response cache is recorded as ``cache_hit``, and
+    one that shared an identical call in flight as ``coalesced``.
+    """
+
+    # Called in the thread that made the call instead of being handed to an executor
+    run_inline = True
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self._spans: Dict[UUID, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, span: Dict[str, Any]) -> None:
+        span["start"] = time.time()
+        span["_t0"] = time.perf_counter()
+        with self._lock:
+            self._spans[run_id] = span
+
+    def _finish(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+        if span is None:
+            return None
+        span["duration"] = time.perf_counter() - span.pop("_t0")
+        span["status"] = "error" if error is not None else "ok"
+        if error is not None:
+            span["error"] = repr(error)
+        return span
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Runnables inside a node inherit its metadata; only the node run itself is a node span
+        if node and kwargs.get("name") == node and not node.startswith("__"):
+            self._start(run_id, {"kind": "node", "node": node, "run_id": str(run_id), "thread_id": metadata.get("thread_id")})
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if span := self._finish(run_id):
+            self.tracer.record(span)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        if span := self._finish(run_id, error):
+            self.tracer.record(span)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        self._start(run_id, {
+            "kind": "llm",
+            "node": metadata.get("langgraph_node"),
+            "model": metadata.get("ls_model_name"),
+            "run_id": str(run_id),
+            "parent_run_id": str(parent_run_id) if parent_run_id else None,
+        })
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        span = self._spans.get(run_id)
+        if span is not None and "ttft" not in span:
+            span["ttft"] = time.perf_counter() - span["_t0"]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._finish(run_id)
+        if span is None:
+            return
+        generations = [generation for batch in response.generations for generation in batch]
+        message = getattr(generations[0], "message", None) if generations else None
+        if message is not None:
+            # LangChain only assigns ids to fresh responses; a cached one keeps its original run's
+            span["cache_hit"] = str(run_id) not in (message.id or "")
+            usage = message.usage_metadata or {}
+            details = usage.get("input_token_details") or {}
+            span["input_tokens"] = usage.get("input_tokens", 0)
+            span["output_tokens"] = usage.get("output_tokens", 0)
+            span["stop_reason"] = message.response_metadata.get("stop_reason")
+            span["cache_read_tokens"] = details.get("cache_read", 0)
+            span["cache_write_tokens"] = details.get("cache_creation", 0)
+            if not span["cache_hit"]:
+                call_stats = message.response_metadata.get("call_stats") or {}
+                span["queue_wait"] = call_stats.get("queue_wait", 0.0)
+                span["retries"] = call_stats.get("retries", 0)
+                span["coalesced"] = call_stats.get("coalesced", False)
+                if "hedge_won" in call_stats:
+                    span["hedge_won"] = call_stats["hedge_won"]
+        self.tracer.record(span)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if span := self._finish(run_id, error):
+            self.tracer.record(span)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    metrics: Metrics
+
+    def do_GET(self):
+        body = self.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Tracer:
+    """Turns finished spans into JSONL lines and Prometheus metrics."""
+
+    def __init__(self, path: Optional[str] = None, port: Optional[int] = None):
+        from utils.cascade import collect_cascade_metrics
+        from utils.llm_client import collect_client_metrics
+
+        self.metrics = Metrics()
+        self.metrics.add_collector(collect_client_metrics)
+        self.metrics.add_collector(collect_cascade_metrics)
+        self.handler = TracingCallbackHandler(self)
+        self._file = None
+        self._file_lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", buffering=1)
+            atexit.register(self._file.close)
+        self.server = None
+        if port:
+            handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"metrics": self.metrics})
+            self.server = ThreadingHTTPServer(("", port), handler)
+            threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+
+    def record(self, span: Dict[str, Any]) -> None:
+        node = span.get("node") or "none"
+        if span["kind"] == "node":
+            self.metrics.observe("workflow_node_duration_seconds", "Wall time of graph node runs", span["duration"], node=node, status=span["status"])
+        else:
+            model = span.get("model") or "unknown"
+            self.metrics.observe("llm_call_duration_seconds", "Wall time of chat model calls", span["duration"], node=node, model=model, status=span["status"])
+            if "ttft" in span:
+                self.metrics.observe("llm_time_to_first_token_seconds", "Time to first streamed token", span["ttft"], node=node, model=model)
+            if "queue_wait" in span:
+                self.metrics.observe("llm_queue_wait_seconds", "Time spent waiting for the rate limiter", span["queue_wait"], node=node, model=model)
+                self.metrics.inc("llm_retries_total", "Throttled attempts that were retried", span["retries"], node=node, model=model)
+            if span.get("cache_hit"):
+                self.metrics.inc("llm_response_cache_hits_total", "Calls answered from the response cache", node=node, model=model)
+            if span.get("coalesced"):
+                self.metrics.inc("llm_coalesced_calls_total", "Calls that shared an identical call in flight", node=node, model=model)
+            # Cache hits and coalesced calls report the tokens of an earlier or shared call
+            spent = not span.get("cache_hit") and not span.get("coalesced")
+            for kind in ("input", "output", "cache_read", "cache_write"):
+                if span.get(f"{kind}_tokens") and spent:
+                    self.metrics.inc("llm_tokens_total", "Tokens by kind", span[f"{kind}_tokens"], node=node, model=model, type=kind)
+        if span["status"] == "error":
+            self.metrics.inc("workflow_errors_total", "Failed node runs and model calls", kind=span["kind"], node=node)
+
+        if self._file is not None:
+            line = json.dumps(span, default=str) + "\n"
+            with self._file_lock:
+                self._file.write(line)
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Process-wide tracer, or ``None`` unless ``TRACE_PATH`` or ``METRICS_PORT`` is set."""
+    global _tracer
+    if _tracer is None and (settings.TRACE_PATH or settings.METRICS_PORT):
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(settings.TRACE_PATH, settings.METRICS_PORT)
+    return _tracer
+
+
+def tracing_callbacks() -> Optional[List[BaseCallbackHandler]]:
+    """Callbacks to attach to a client, or ``None`` when tracing is off."""
+    tracer = get_tracer()
+    return [tracer.handler] if tracer else None
+
+
+def instrument(graph):
+    """Trace every node of a compiled graph; returns ``graph`` itself when tracing is off."""
+    tracer = get_tracer()
+    if tracer is None:
+        return graph
+    return graph.with_config(callbacks=[tracer.handler])
+
+
+def summarize(path: str) -> Dict[str, Dict[str, float]]:
+    """p50/p95/p99 wall time (ms) per span kind and node from a span file."""
+    durations: Dict[str, List[float]] = defaultdict(list)
+    with open(path) as file:
+        for line in file:
+            span = json.loads(line)
+            durations[f"{span['kind']}:{span.get('node') or 'none'}"].append(span["duration"] * 1000)
+    summary = {}
+    for key, values in durations.items():
+        values.sort()
+        pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+        summary[key] = {"count": len(values), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "total": sum(values)}
+    return summary
+
+
+def suggest_output_budgets(path: str, quantile: float = 0.99, headroom: float = 1.25, truncation_limit: float = 0.01) -> Dict[str, Dict[str, Any]]:
+    """Output budget (max_tokens) per node from the ``output_tokens`` observed in a span file.
+
+    The suggestion is the ``quantile`` of the node's output tokens plus
+    ``headroom``, rounded up to a multiple of 64. Calls that hit their cap
+    (``stop_reason == "max_tokens"``) hide how long the answer wanted to be,
+    so a node truncated more often than ``truncation_limit`` gets double its
+    current budget instead. Cache hits and coalesced calls are skipped.
+    """
+    from utils.llm_client import node_output_budget
+
+    tokens: Dict[str, List[int]] = defaultdict(list)
+    truncated: Dict[str, int] = defaultdict(int)
+    with open(path) as file:
+        for line in file:
+            span = json.loads(line)
+            if span["kind"] != "llm" or span["status"] != "ok" or span.get("cache_hit") or span.get("coalesced"):
+                continue
+            node = span.get("node") or "none"
+            tokens[node].append(span.get("output_tokens", 0))
+            truncated[node] += span.get("stop_reason") == "max_tokens"
+    suggestions = {}
+    for node, values in tokens.items():
+        values.sort()
+        pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+        current = node_output_budget(node)
+        share = truncated[node] / len(values)
+        if current and share > truncation_limit:
+            suggested = 2 * current
+        else:
+            suggested = max(64, -(-int(pick(quantile) * headroom) // 64) * 64)
+        suggestions[node] = {
+            "count": len(values),
+            "p50": pick(0.5),
+            "p99": pick(0.99),
+            "max": values[-1],
+            "truncated": share,
+            "current": current,
+            "suggested": suggested,
+        }
+    return suggestions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m utils.tracing", description="Summarize a span file.")
+    parser.add_argument("path", nargs="?", default=settings.TRACE_PATH)
+    parser.add_argument("--budgets", action="store_true", help="suggest per-node output budgets from the observed output tokens")
+    args = parser.parse_args()
+
+    if args.budgets:
+        # Importing the workflows declares their current budgets
+        from run_workflow import WORKFLOWS, load_workflow
+
+        for name in WORKFLOWS:
+            load_workflow(name)
+        print(f"{'node':<28}{'calls':>8}{'p50':>8}{'p99':>8}{'max':>8}{'truncated':>11}{'current':>9}{'suggested':>11}")
+        for node, row in sorted(suggest_output_budgets(args.path).items()):
+            print(f"{node:<28}{row['count']:>8}{row['p50']:>8}{row['p99']:>8}{row['max']:>8}{row['truncated']:>11.1%}{row['current'] or '-':>9}{row['suggested']:>11}")
+    else:
+        rows = sorted(summarize(args.path).items(), key=lambda item: -item[1]["p99"])
+        print(f"{'span':<40}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'total s':>10}")
+        for key, row in rows:
+            print(f"{key:<40}{row['count']:>8}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}{row['total'] / 1000:>10.2f}")